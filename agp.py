@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from report import segment_quantile
+
+AGP_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def agp(series, bin_minutes=5, percentiles=AGP_PERCENTILES):
+    """
+        Computes the Ambulatory Glucose Profile: the distribution of glucose per time-of-day bin.
+        The readings are binned by integer minute of the day and sorted once by (bin, y), so that
+        every bin is a sorted segment and all percentile bands come from the same index arithmetic
+        Args:
+            series (CgmSeries): compact glucose series
+            bin_minutes (integer): width of the time-of-day bins in minutes (default=5)
+            percentiles (tuple): percentiles to compute (default=5, 25, 50, 75, 95)
+        Returns:
+            df (pd.DataFrame): one row per bin, indexed by the minute of the day the bin starts, with
+                n, mean, std (ddof=1) and one p<percentile> column per percentile (NaN for empty bins)
+
+    """
+    n_bins = -(-1440 // bin_minutes)
+    bins = series.minute // bin_minutes
+    y = series.y.astype(float)
+    order = np.lexsort((y, bins))
+    sorted_y = y[order]
+    bounds = np.searchsorted(bins[order], np.arange(n_bins + 1))
+
+    n = np.diff(bounds)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(bins, weights=y, minlength=n_bins) / n
+        sum_sq = np.bincount(bins, weights=y*y, minlength=n_bins)
+        std = np.sqrt(np.maximum(sum_sq - n*mean**2, 0) / (n - 1))
+    df = pd.DataFrame({'n': n, 'mean': mean, 'std': np.where(n > 1, std, np.nan)},
+                      index=pd.Index(np.arange(n_bins)*bin_minutes, name='minute'))
+    for p in percentiles:
+        df[f'p{p}'] = segment_quantile(sorted_y, bounds, p / 100)
+    return df
@@ -1,14 +1,22 @@
+import time as clock
+import requests
 import streamlit as st
 from datetime import time
 from util import FinalData ,CgmMetric
+from cache import parse_cache
+from store import STORE_ROOT, ReadingStore
+from nightscout import NightscoutClient
 # from auth_config import firebase_instances
 
+# seconds between automatic Nightscout syncs, so that filter changes do not refetch or invalidate the caches
+SYNC_INTERVAL = 300
+
 def main():
 
     with st.container():
         st.title('Dynamic Ambulatory Glucose Profile (dAGP)')
         st.header('Input your Libre data and select your filters')
-        devices = ['Freestyle Libre', 'Dexcom', 'Nightscout']
+        devices = ['Auto-detect', 'Freestyle Libre', 'Dexcom', 'Nightscout']
         st.session_state.device = st.selectbox('Select your device', devices)
         st.session_state.data = st.file_uploader('Upload the glucose data downloaded from the LibreView website', type='csv')
         ranges = ['2 weeks', '1 month', '3 months', '6 months', '1 year', 'All times']
@@ -26,66 +34,110 @@ def main():
         else:
             st.session_state.start_time = None
             st.session_state.end_time = None
-        if st.session_state.data is not None:
-            cgm_data = FinalData(st.session_state.data, st.session_state.device, st.session_state.time_range, st.session_state.week_day, st.session_state.start_time, st.session_state.end_time)
+        # the store is opt-in, see STORE_ROOT
+        store_name = None
+        if STORE_ROOT is not None:
+            store_name = st.text_input('Keep your data between sessions under this name (optional)')
+        if store_name is not None and st.session_state.device == 'Nightscout':
+            site = st.text_input('Or sync from your Nightscout site (needs the name above)', placeholder='https://example.herokuapp.com')
+            token = st.text_input('Nightscout access token (optional)', type='password')
+            sync_now = st.button('Sync')
+        else:
+            site = token = None
+            sync_now = False
+        source = st.session_state.data
+        if store_name:
+            try:
+                store = ReadingStore(store_name)
+            except ValueError:
+                st.error('Please use only letters, numbers, dots, dashes and underscores in the name.')
+                st.stop()
+            if site:
+                # sync on the first run for this site, on Sync, or once SYNC_INTERVAL has passed
+                last_sync = st.session_state.get('last_sync')
+                due = last_sync is None or last_sync[0] != (store_name, site) or clock.time() - last_sync[1] >= SYNC_INTERVAL
+                if sync_now or due:
+                    # a failed attempt also waits for the interval, unless Sync is clicked
+                    st.session_state.last_sync = ((store_name, site), clock.time())
+                    try:
+                        st.session_state.synced = NightscoutClient(site, store, token=token or None).sync()
+                    except (requests.RequestException, ValueError):
+                        st.session_state.synced = None
+                        st.error('We could not reach your Nightscout site. Please check the address and the token.')
+                if st.session_state.get('synced') is not None:
+                    st.caption(f'{st.session_state.synced} new readings synced from Nightscout.')
+            if st.session_state.data is not None:
+                upload = FinalData(st.session_state.data, st.session_state.device, 'All times', 'Every Day', None, None)
+                series = upload.index()
+                # merge each upload once, not on every rerun caused by the filters
+                if st.session_state.get('merged') != (store_name, upload._key):
+                    st.session_state.added = store.merge(series)
+                    st.session_state.merged = (store_name, upload._key)
+                st.caption(f'{st.session_state.added} new readings saved under {store_name}.')
+            if not store.empty:
+                source = store
+        if source is not None:
+            cgm_data = FinalData(source, st.session_state.device, st.session_state.time_range, st.session_state.week_day, st.session_state.start_time, st.session_state.end_time)
             filtered_df, filtered_df2, st.session_state.start_date, st.session_state.final_date = cgm_data.filter_data
             cgm = CgmMetric(filtered_df)
-            if filtered_df2.empty:
-                cgm2 = None
-            else:
-                cgm2 = CgmMetric(filtered_df2)
+            comparison = cgm_data.compare()
             st.header('Check the resulting metrics below')
             b_day = cgm.best_day()
             st.subheader(f'Your data goes from {st.session_state.start_date} to {st.session_state.final_date}')
+            st.caption(f'The sensor was worn {cgm_data.sensor_wear():.1f}% of this period.')
             st.subheader(f'The lowest GMI was on the {b_day}')
+            st.subheader(f'The highest GMI was on the {cgm.worst_day()}')
 
             with st.container():
 
                 col1, col2, col3, col4 = st.columns(4)
 
-                st.session_state.n_data = cgm.available_data()
-                st.session_state.avg = round(cgm.average_glucose(), 2)
-                st.session_state.std = round(cgm.sd(),1)
-                st.session_state.ea1c = round(cgm.eA1c(), 2)
-                st.session_state.trange = round(cgm.time_in_range(), 1)
+                metrics = comparison.current
+                st.session_state.n_data = metrics.available_data
+                st.session_state.avg = round(metrics.average_glucose, 2)
+                st.session_state.std = round(metrics.sd,1)
+                st.session_state.ea1c = round(metrics.eA1c, 2)
+                st.session_state.trange = round(metrics.time_in_range, 1)
                 trange_str = f'{st.session_state.trange}%'
-                st.session_state.thyper = round(cgm.hyper_time(), 1)
+                st.session_state.thyper = round(metrics.hyper_time, 1)
                 thyper_str = f'{st.session_state.thyper}%'
-                st.session_state.thypo = round(cgm.hypo_time(), 1)
+                st.session_state.thypo = round(metrics.hypo_time, 1)
                 thypo_str = f'{st.session_state.thypo}%'
-                st.session_state.iqr = int(cgm.inter_qr())
-                st.session_state.intersd = int(cgm.interdaysd())
-                st.session_state.intrasd = int(cgm.intradaysd()[0])
-                st.session_state.mage = round(cgm.MAGE(), 1)
-                st.session_state.jindex = round(cgm.J_index(), 2)
-                st.session_state.lgbi = round(cgm.LBGI(), 2)
-                st.session_state.hbgi = round(cgm.HBGI(), 2)
-                # adrr = round(cgm_metrics.ADRR(), 2)
-                st.session_state.modd = round(cgm.MODD(), 2)
-                st.session_state.conga = round(cgm.CONGA24(), 2)
-                st.session_state.gmi = round(cgm.GMI(), 2)
+                st.session_state.iqr = int(metrics.inter_qr)
+                st.session_state.intersd = int(metrics.interdaysd)
+                st.session_state.intrasd = int(metrics.intradaysd)
+                st.session_state.mage = round(metrics.MAGE, 1)
+                st.session_state.jindex = round(metrics.J_index, 2)
+                st.session_state.lgbi = round(metrics.LBGI, 2)
+                st.session_state.hbgi = round(metrics.HBGI, 2)
+                st.session_state.adrr = round(metrics.ADRR, 2)
+                st.session_state.modd = round(metrics.MODD, 2)
+                st.session_state.conga = round(metrics.CONGA24, 2)
+                st.session_state.gmi = round(metrics.GMI, 2)
                 
-                if cgm2 is not None:
+                if comparison.previous and comparison.previous[0].available_data:
 
                     st.info(f'As you selected a {st.session_state.time_range} time range, your metrics will be compared to the previous {st.session_state.time_range} data.')
 
-                    st.session_state.n_data_delta = st.session_state.n_data-cgm2.available_data()
-                    st.session_state.avg_delta = round(st.session_state.avg-cgm2.average_glucose(), 2)
-                    st.session_state.std_delta = round(st.session_state.std-cgm2.sd(),2)
-                    st.session_state.ea1c_delta = round(st.session_state.ea1c-cgm2.eA1c(), 2)
-                    st.session_state.trange_delta = f'{round(st.session_state.trange-cgm2.time_in_range(), 2)}%'
-                    st.session_state.thyper_delta = f'{round(st.session_state.thyper-cgm2.hyper_time(), 2)}%'
-                    st.session_state.thypo_delta = f'{round(st.session_state.thypo-cgm2.hypo_time(), 2)}%'
-                    st.session_state.iqr_delta = st.session_state.iqr-cgm2.inter_qr()
-                    st.session_state.intersd_delta = round(st.session_state.intersd-cgm2.interdaysd(), 1)
-                    st.session_state.intrasd_delta = round(st.session_state.intrasd-cgm2.intradaysd()[0], 1)
-                    st.session_state.mage_delta = round(st.session_state.mage-cgm2.MAGE(), 2)
-                    st.session_state.jindex_delta = round(st.session_state.jindex-cgm2.J_index(), 2)
-                    st.session_state.lgbi_delta = round(st.session_state.lgbi-cgm2.LBGI(), 2)
-                    st.session_state.hbgi_delta = round(st.session_state.hbgi-cgm2.HBGI(), 2)
-                    st.session_state.modd_delta = round(st.session_state.modd-cgm2.MODD(), 2)
-                    st.session_state.conga_delta = round(st.session_state.conga-cgm2.CONGA24(), 2)
-                    st.session_state.gmi_delta = round(st.session_state.gmi-cgm2.GMI(), 2)
+                    metrics2 = comparison.previous[0]
+                    st.session_state.n_data_delta = st.session_state.n_data-metrics2.available_data
+                    st.session_state.avg_delta = round(st.session_state.avg-metrics2.average_glucose, 2)
+                    st.session_state.std_delta = round(st.session_state.std-metrics2.sd,2)
+                    st.session_state.ea1c_delta = round(st.session_state.ea1c-metrics2.eA1c, 2)
+                    st.session_state.trange_delta = f'{round(st.session_state.trange-metrics2.time_in_range, 2)}%'
+                    st.session_state.thyper_delta = f'{round(st.session_state.thyper-metrics2.hyper_time, 2)}%'
+                    st.session_state.thypo_delta = f'{round(st.session_state.thypo-metrics2.hypo_time, 2)}%'
+                    st.session_state.iqr_delta = st.session_state.iqr-metrics2.inter_qr
+                    st.session_state.intersd_delta = round(st.session_state.intersd-metrics2.interdaysd, 1)
+                    st.session_state.intrasd_delta = round(st.session_state.intrasd-metrics2.intradaysd, 1)
+                    st.session_state.mage_delta = round(st.session_state.mage-metrics2.MAGE, 2)
+                    st.session_state.jindex_delta = round(st.session_state.jindex-metrics2.J_index, 2)
+                    st.session_state.lgbi_delta = round(st.session_state.lgbi-metrics2.LBGI, 2)
+                    st.session_state.hbgi_delta = round(st.session_state.hbgi-metrics2.HBGI, 2)
+                    st.session_state.adrr_delta = round(st.session_state.adrr-metrics2.ADRR, 2)
+                    st.session_state.modd_delta = round(st.session_state.modd-metrics2.MODD, 2)
+                    st.session_state.conga_delta = round(st.session_state.conga-metrics2.CONGA24, 2)
+                    st.session_state.gmi_delta = round(st.session_state.gmi-metrics2.GMI, 2)
 
                     col1.metric(label="GMI", value=st.session_state.gmi, delta=st.session_state.gmi_delta, delta_color="inverse")
                     col1.metric(label="Time in range", value=trange_str, delta=st.session_state.trange_delta)
@@ -95,6 +147,7 @@ def main():
                     col2.metric(label="Intraday SD", value=f'{st.session_state.intrasd}mg/dL', delta=f'{st.session_state.intrasd_delta}mg/dL', delta_color="inverse")
                     col2.metric(label='Interquartile range', value=f'{st.session_state.iqr}mg/dL', delta=f'{st.session_state.iqr_delta}mg/dL', delta_color="inverse")
                     col2.metric(label="HBGI", value=st.session_state.hbgi, delta=st.session_state.hbgi_delta, delta_color="inverse")
+                    col2.metric(label="ADRR", value=st.session_state.adrr, delta=st.session_state.adrr_delta, delta_color="inverse")
                     col3.metric(label="Standard Deviation (SD)", value=f'{st.session_state.std}mg/dL', delta=f'{st.session_state.std_delta}mg/dL', delta_color="inverse")
                     col3.metric(label="Interday SD", value=f'{st.session_state.intersd}mg/dL', delta=f'{st.session_state.intersd_delta}mg/dL', delta_color="inverse")
                     col3.metric(label="MAGE", value=f'{st.session_state.mage}mg/dL', delta=f'{st.session_state.mage_delta}mg/dL', delta_color="inverse")
@@ -114,6 +167,7 @@ def main():
                     col2.metric(label="Intraday SD", value=f'{st.session_state.intrasd}mg/dL')
                     col2.metric(label='Interquartile range', value=f'{st.session_state.iqr}mg/dL')
                     col2.metric(label="HBGI", value=st.session_state.hbgi)
+                    col2.metric(label="ADRR", value=st.session_state.adrr)
                     col3.metric(label="Standard Deviation (SD)", value=f'{st.session_state.std}mg/dL')
                     col3.metric(label="Interday SD", value=f'{st.session_state.intersd}mg/dL')
                     col3.metric(label="MAGE", value=f'{st.session_state.mage}mg/dL')
@@ -123,12 +177,25 @@ def main():
                     col4.metric(label="J-Index", value=st.session_state.jindex)
                     col4.metric(label="Number of measurements", value=st.session_state.n_data)
 
+            with st.container():
+
+                st.subheader('Hypo and hyper episodes')
+                st.caption('Episodes start after 15 minutes beyond the limit and end after 15 minutes back within it.')
+                summary = cgm.episode_summary().rename(columns={'episodes': 'Episodes', 'mean_duration': 'Mean duration (min)',
+                                                                'total_duration': 'Total duration (min)', 'extreme': 'Nadir/peak (mg/dL)'})
+                st.dataframe(summary.round(1))
+
             with st.container():
                 
                 st.header('Visualize glucose data') 
-                cgm.histogram()
+                cgm.histogram('extended' if st.checkbox('Split the ranges into five tiers') else 'standard')
                 cgm.scatter()
                 cgm.one_day_scatter()
+                cgm.agp_chart()
+                CgmMetric(cgm_data.period(None, None)).rolling_chart()
+
+            cache_stats = parse_cache.stats()
+            st.caption(f"Upload cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries kept")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
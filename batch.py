@@ -0,0 +1,165 @@
+import argparse
+import csv
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+from report import MetricsReport
+
+COLUMNS = ['patient', 'file', 'period', 'start', 'end'] + list(MetricsReport._fields) + ['sensor_wear', 'error']
+
+
+class FileTimeout(BaseException):
+    # like KeyboardInterrupt, not an Exception, so that the handlers around parsing do not swallow it
+    pass
+
+
+def patient_rows(path, device='Auto-detect', time_range='All times', n_previous=1, timeout=None):
+    """
+        Computes the metrics of one export, one row per period, isolating any failure in an error row
+        Args:
+            path (str): path to the export
+            device (str): device of the export, or 'Auto-detect'
+            time_range (str or integer): label of FinalData.ranges, a number of days or 'All times'
+            n_previous (integer): number of earlier periods of the same length (default=1)
+            timeout (float): seconds allowed for the file, None for no limit (needs SIGALRM)
+        Returns:
+            rows (list): dicts with the COLUMNS keys, period 0 being the most recent
+
+    """
+    from util import DataError, FinalData, StopException
+
+    patient = Path(path).stem
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        data = FinalData(path, device, time_range, 'Every Day', None, None)
+        edges = data.edges(n_previous)
+        comparison = data.compare(n_previous)
+        grid = data.grid()
+        rows = []
+        for period, report in enumerate((comparison.current,) + comparison.previous):
+            start, end = edges[-2 - period], edges[-1 - period]
+            row = {'patient': patient, 'file': str(path), 'period': period,
+                   'start': pd.Timestamp(start + 1, unit='s'), 'end': pd.Timestamp(end, unit='s')}
+            row.update(report._asdict())
+            row.update({'sensor_wear': grid.wear(start, end), 'error': None})
+            rows.append(row)
+        return rows
+    except (DataError, FileTimeout, StopException, Exception) as error:
+        # FinalData.fail raises DataError with the message the app would show. FileTimeout and
+        # Streamlit's StopException derive from BaseException, so they are listed on their own
+        message = str(error) or 'The file could not be read as a supported export'
+        return [{**dict.fromkeys(COLUMNS), 'patient': patient, 'file': str(path), 'error': message}]
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _raise_timeout(signum, frame):
+    raise FileTimeout('The file took too long to process')
+
+
+class ResultWriter:
+    """
+        Streams result rows to a CSV or Parquet file (chosen by extension) as they arrive
+    """
+
+    def __init__(self, path, batch_size=256):
+        self.path = str(path)
+        self.parquet = self.path.endswith('.parquet')
+        self.batch_size = batch_size
+        self.pending = []
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            fields = [pa.field(name, pa.float64()) for name in COLUMNS]
+            fields[:5] = [pa.field('patient', pa.string()), pa.field('file', pa.string()), pa.field('period', pa.int64()),
+                          pa.field('start', pa.timestamp('s')), pa.field('end', pa.timestamp('s'))]
+            fields[-1] = pa.field('error', pa.string())
+            self.schema = pa.schema(fields)
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            self.handle = open(self.path, 'w', newline='')
+            self.writer = csv.DictWriter(self.handle, COLUMNS)
+            self.writer.writeheader()
+
+    def write(self, rows):
+        if not self.parquet:
+            self.writer.writerows(rows)
+            self.handle.flush()
+            return
+        self.pending.extend(rows)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.parquet and self.pending:
+            import pyarrow as pa
+            table = pd.DataFrame(self.pending, columns=COLUMNS)
+            table['period'] = table['period'].astype('Int64')
+            self.writer.write_table(pa.Table.from_pandas(table, schema=self.schema, preserve_index=False))
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.parquet:
+            self.writer.close()
+        else:
+            self.handle.close()
+
+
+def run(paths, output, device='Auto-detect', time_range='All times', n_previous=1, workers=None, timeout=None):
+    """
+        Computes the metrics of many exports over a process pool, writing each file's rows as soon
+        as it is done; a failing or slow file only produces an error row
+        Args:
+            paths (list): paths to the exports
+            output (str): .csv or .parquet file to write
+            device, time_range, n_previous, timeout: see patient_rows
+            workers (integer): number of processes (default=number of CPUs)
+        Returns:
+            summary (tuple): number of files processed and number of files that failed
+
+    """
+    writer = ResultWriter(output)
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(patient_rows, str(path), device, time_range, n_previous, timeout) for path in paths]
+            for future in as_completed(futures):
+                rows = future.result()
+                failed += rows[0]['error'] is not None
+                writer.write(rows)
+    finally:
+        writer.close()
+    return len(paths), failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute Glucodash metrics for a directory of CGM exports.')
+    parser.add_argument('directory', help='directory with one export per patient')
+    parser.add_argument('-o', '--output', default='metrics.csv', help='.csv or .parquet file to write (default: metrics.csv)')
+    parser.add_argument('--pattern', default='*.csv', help='glob of the exports inside the directory (default: *.csv)')
+    parser.add_argument('--device', default='Auto-detect', help="device of the exports (default: Auto-detect)")
+    parser.add_argument('--time-range', default='All times', help="'All times', a range such as '2 weeks', or a number of days")
+    parser.add_argument('--previous', type=int, default=1, help='earlier periods of the same length to include (default: 1)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes (default: all CPUs)')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds allowed per file, 0 for no limit (default: 300)')
+    args = parser.parse_args(argv)
+
+    time_range = int(args.time_range) if args.time_range.isdigit() else args.time_range
+    paths = sorted(Path(args.directory).glob(args.pattern))
+    if not paths:
+        parser.error(f'No file matches {args.pattern} in {args.directory}')
+    total, failed = run(paths, args.output, args.device, time_range, args.previous, args.workers, args.timeout or None)
+    print(f'{total - failed} of {total} files processed, results in {args.output}', file=sys.stderr)
+    return 1 if failed == total else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
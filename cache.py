@@ -0,0 +1,103 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def content_key(raw: bytes, *parts):
+    """
+        Builds a cache key from the content of an upload and the settings used to read it
+        Args:
+            raw (bytes): content of the uploaded file
+            parts (str): any other value the parsed result depends on (e.g. the device)
+        Returns:
+            key (tuple): hash of the content followed by the extra parts
+
+    """
+    return (hashlib.blake2b(raw, digest_size=16).hexdigest(),) + parts
+
+
+def array_key(*arrays):
+    """
+        Hashes the content of arrays, to cache results derived from them
+        Args:
+            arrays (np.ndarray): the arrays the result depends on
+        Returns:
+            key (str): hex digest of their bytes
+
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+def sizeof(value):
+    """
+        Estimates the memory used by a cached value
+        Args:
+            value (object): DataFrame, array-backed object, tuple of those or any Python object
+        Returns:
+            size (int): estimated size in bytes
+
+    """
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, tuple):
+        return sum(sizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+        Least recently used cache bounded by a number of entries and a memory budget.
+        Instances live at module level so they survive Streamlit reruns.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=512 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._bytes}
+
+
+# parsed uploads, keyed by content_key(raw, device)
+parse_cache = LRUCache()
+
+# chart tables of filtered series, keyed by CgmSeries.fingerprint() and the chart settings
+chart_cache = LRUCache(max_entries=64, max_bytes=64 * 2**20)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from series import CgmSeries
+from periods import group_metrics
+
+
+def cohort_metrics(df, time_range=None, n_previous=0, patient='patient_id', timestamp='timestamp', glucose='glucose'):
+    """
+        Computes the metric panel of every patient and period of a long-format cohort table at once.
+        The readings are sorted once by (patient, time) and labelled with a (patient, period) group,
+        so the whole cohort is a single group_metrics pass instead of one CgmMetric per patient.
+        Periods end at each patient's last reading, like FinalData.edges
+        Args:
+            df (pd.DataFrame): one row per reading with patient, timestamp and glucose (mg/dL) columns
+            time_range (integer): period length in days, None for all of each patient's readings
+            n_previous (integer): number of earlier periods of the same length (default=0)
+            patient, timestamp, glucose (str): column names (default='patient_id', 'timestamp', 'glucose')
+        Returns:
+            df (pd.DataFrame): one row per patient and period (0 being the most recent) with patient_id,
+                period, start, end and the MetricsReport fields
+
+    """
+    if time_range is None:
+        n_previous = 0
+    n_periods = n_previous + 1
+    code, patients = pd.factorize(df[patient], sort=True)
+    ds = pd.to_datetime(df[timestamp])
+    if ds.dt.tz is not None:
+        # wall-clock time, as the device exports are read
+        ds = ds.dt.tz_localize(None)
+    ts = ds.to_numpy().astype('datetime64[s]').astype(np.int64)
+    y = pd.to_numeric(df[glucose], errors='coerce').to_numpy(dtype=float)
+
+    keep = (code >= 0) & ~np.isnan(y) & ~ds.isna().to_numpy()
+    code, ts, y = code[keep], ts[keep], y[keep]
+    if len(ts):
+        # (patient, time) packed into one int64 key: one stable argsort, skipped when already sorted
+        key = (code.astype(np.int64) << 40) + (ts - ts.min())
+        if (np.diff(key) < 0).any():
+            order = np.argsort(key, kind='stable')
+            code, ts, y = code[order], ts[order], y[order]
+    # the first reading of a repeated (patient, timestamp) wins
+    unique = (np.diff(code, prepend=-1) != 0) | (np.diff(ts, prepend=ts[:1] - 1) != 0)
+    code, ts, y = code[unique], ts[unique], y[unique]
+
+    n_patients = len(patients)
+    bounds = np.searchsorted(code, np.arange(n_patients + 1))
+    present = bounds[1:] > bounds[:-1]
+    padded = np.r_[ts, 0]
+    first = np.where(present, padded[bounds[:-1]], 0)
+    last = np.where(present, padded[bounds[1:] - 1], 0)
+    if time_range is None:
+        period = np.zeros(len(ts), dtype=np.int64)
+        length = None
+    else:
+        length = int(time_range*86400)
+        period = (last[code] - ts) // length
+    inside = period < n_periods
+    code, ts, y, period = code[inside], ts[inside], y[inside], period[inside]
+
+    # oldest period first inside each patient keeps the groups sorted by time
+    group = code*n_periods + (n_periods - 1 - period)
+    panel = group_metrics(CgmSeries(ts, y), group, n_patients*n_periods)
+
+    period = np.tile(np.arange(n_periods - 1, -1, -1), n_patients)
+    end = np.repeat(last, n_periods)
+    if length is None:
+        start = np.repeat(first, n_periods) - 1
+    else:
+        end = end - period*length
+        start = end - length
+    valid = np.repeat(present, n_periods)
+    panel.insert(0, 'patient_id', np.repeat(patients.to_numpy(), n_periods))
+    panel.insert(1, 'period', period)
+    panel.insert(2, 'start', pd.to_datetime(np.where(valid, start + 1, 0), unit='s'))
+    panel.insert(3, 'end', pd.to_datetime(np.where(valid, end, 0), unit='s'))
+    panel = panel[valid]
+    return panel.sort_values(['patient_id', 'period'], kind='stable').reset_index(drop=True)
@@ -0,0 +1 @@
+# puts the repository root on sys.path, so tests import the top-level modules
@@ -0,0 +1,140 @@
+import numpy as np
+from report import SufficientStats
+
+
+class StatsCube:
+    """
+        Additive statistics (count, sum, sum of squares, hypo/in range/hyper counts) of a series
+        per calendar day and time-of-day bin, built once per upload. Running sums over the days
+        of each weekday answer the whole days of any window, weekday set and times of day in
+        O(bins); only the cells cut by a boundary are read from the raw readings, so the results
+        match the raw filters exactly.
+    """
+
+    def __init__(self, series, bin_minutes=5):
+        self.series = series
+        self.bin_seconds = bin_minutes*60
+        self.n_bins = 1440 // bin_minutes
+        self.first_day = int(series.day[0]) if len(series) else 0
+        n_days = int(series.day[-1]) - self.first_day + 1 if len(series) else 0
+        # whole weeks, so that the days of each weekday are a column of the (weeks, 7) layout
+        n_weeks = -(-n_days // 7)
+        n_cells = n_weeks*7*self.n_bins
+
+        # cells are numbered in time order, so a reading's cell is its offset from the first midnight
+        cell = (series.ts - self.first_day*86400) // self.bin_seconds
+        y = series.y.astype(float)
+        self.cells = np.stack([
+            np.bincount(cell, minlength=n_cells),
+            np.bincount(cell, weights=y, minlength=n_cells),
+            np.bincount(cell, weights=y*y, minlength=n_cells),
+            np.bincount(cell, weights=y < 70, minlength=n_cells),
+            np.bincount(cell, weights=(y >= 70) & (y <= 180), minlength=n_cells),
+            np.bincount(cell, weights=y > 180, minlength=n_cells),
+        ])
+        weeks = self.cells.reshape(6, n_weeks, 7, self.n_bins)
+        self.running = np.zeros((6, n_weeks + 1, 7, self.n_bins))
+        np.cumsum(weeks, axis=1, out=self.running[:, 1:])
+        self.offsets = np.searchsorted(cell, np.arange(n_cells + 1))
+        # weekday of the days in each column, Monday=0
+        self.weekday = (self.first_day + np.arange(7) + 3) % 7
+
+    @property
+    def nbytes(self):
+        return self.cells.nbytes + self.running.nbytes + self.offsets.nbytes
+
+    def query(self, start=None, end=None, weekdays=None, time_ranges=None):
+        """
+            Sums the statistics of the readings with start < ts <= end on the given weekdays and times of day
+            Args:
+                start (integer): epoch seconds, exclusive (None for the first reading)
+                end (integer): epoch seconds, inclusive (None for the last reading)
+                weekdays (iterable): weekday numbers, Monday=0 (None for every day)
+                time_ranges (list): (start, end) pairs of datetime.time, as in CgmSeries.select
+            Returns:
+                stats (SufficientStats): additive statistics of the selection (sorted_y is None)
+
+        """
+        origin = self.first_day*86400
+        n_cells = self.cells.shape[1]
+        c0 = 0 if start is None else int(np.clip((start + 1 - origin) // self.bin_seconds, 0, n_cells))
+        c1 = n_cells - 1 if end is None else int(np.clip((end - origin) // self.bin_seconds, -1, n_cells - 1))
+        totals = np.zeros(6)
+        if c1 < c0:
+            return self._stats(totals)
+
+        day_ok = np.ones(7, dtype=bool) if weekdays is None else np.isin(self.weekday, list(weekdays))
+        full_bins, partial_bins = self._bins(time_ranges)
+        # whole days of the window come from the running sums, its first and last days cell by cell
+        first, last = -(-c0 // self.n_bins), (c1 + 1) // self.n_bins - 1
+        partial = []
+        if first <= last:
+            column = np.arange(7)
+            lo = (first + (column - first) % 7) // 7
+            hi = (last - (last - column) % 7) // 7 + 1
+            days = np.where(day_ok & (hi > lo), 1.0, 0.0)
+            by_bin = ((self.running[:, hi, column] - self.running[:, lo, column])*days[:, None]).sum(axis=1)
+            totals += by_bin[:, full_bins].sum(axis=1)
+            if partial_bins.any():
+                day = np.arange(first, last + 1)
+                day = day[day_ok[day % 7]]
+                partial.append((day[:, None]*self.n_bins + np.flatnonzero(partial_bins)).ravel())
+            edges = np.r_[c0:first*self.n_bins, (last + 1)*self.n_bins:c1 + 1]
+        else:
+            edges = np.arange(c0, c1 + 1)
+
+        if len(edges):
+            keep = day_ok[(edges // self.n_bins) % 7]
+            bins = edges % self.n_bins
+            full = keep & full_bins[bins]
+            cut = keep & partial_bins[bins]
+            # the cells holding the window limits may be cut too
+            for edge, bound in ((c0, start), (c1, end)):
+                if bound is not None:
+                    at = edges == edge
+                    cut |= at & full
+                    full &= ~at
+            totals += self.cells[:, edges[full]].sum(axis=1)
+            partial.append(edges[cut])
+
+        partial = np.concatenate(partial) if partial else np.empty(0, dtype=np.int64)
+        if len(partial):
+            totals += self._raw(partial, start, end, weekdays, time_ranges)
+        return self._stats(totals)
+
+    def _raw(self, cells, start, end, weekdays, time_ranges):
+        # statistics of the readings of the given cells that pass the filters exactly
+        first = self.offsets[cells]
+        counts = self.offsets[cells + 1] - first
+        index = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        readings = self.series.take(np.sort(index))
+        readings = readings.take(readings.select(weekdays, time_ranges))
+        inside = np.ones(len(readings), dtype=bool)
+        if start is not None:
+            inside &= readings.ts > start
+        if end is not None:
+            inside &= readings.ts <= end
+        y = readings.y[inside].astype(float)
+        return [len(y), y.sum(), np.dot(y, y), (y < 70).sum(), ((y >= 70) & (y <= 180)).sum(), (y > 180).sum()]
+
+    def _bins(self, time_ranges):
+        # bins entirely inside a time range, and bins only partly inside one
+        if not time_ranges:
+            return np.ones(self.n_bins, dtype=bool), np.zeros(self.n_bins, dtype=bool)
+        first = np.arange(self.n_bins)*self.bin_seconds
+        last = first + self.bin_seconds - 1
+        full = np.zeros(self.n_bins, dtype=bool)
+        overlap = np.zeros(self.n_bins, dtype=bool)
+        for start, end in time_ranges:
+            start = start.hour*3600 + start.minute*60 + start.second
+            end = end.hour*3600 + end.minute*60 + end.second
+            spans = [(start, end)] if start <= end else [(start, 86399), (0, end)]
+            for lo, hi in spans:
+                full |= (first >= lo) & (last <= hi)
+                overlap |= (last >= lo) & (first <= hi)
+        return full, overlap & ~full
+
+    @staticmethod
+    def _stats(totals):
+        n, total, sum_sq, n_hypo, n_range, n_hyper = totals
+        return SufficientStats(int(n), total, sum_sq, int(n_hypo), int(n_range), int(n_hyper), None)
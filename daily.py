@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from risk import risk_space
+from report import gmi
+
+DAILY_COLUMNS = ['n', 'mean', 'sd', 'CV', 'time_in_range', 'hypo_time', 'hyper_time', 'LBGI', 'HBGI', 'GMI', 'max_rl', 'max_rh', 'risk_range']
+
+
+def day_starts(day):
+    """
+        Finds where each calendar day starts in a time-sorted series
+        Args:
+            day (np.ndarray): day ordinal of each reading, in time order
+        Returns:
+            starts (np.ndarray): position of the first reading of each day
+
+    """
+    if len(day) == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+
+
+def daily_table(series, starts=None, risk=None):
+    """
+        Computes the metrics of every calendar day in one grouped pass: as the series is sorted,
+        the readings of a day are contiguous and every column is one reduceat over the day starts
+        Args:
+            series (CgmSeries): compact glucose series
+            starts (np.ndarray): first position of each group, day_starts(series.day) when None;
+                finer groups (e.g. days split by period) are accepted as long as they are contiguous
+            risk (tuple): rl and rh from risk_space, computed when None
+        Returns:
+            df (pd.DataFrame): one row per group, indexed by day, with n, mean, population sd, CV,
+                time_in_range, hypo_time, hyper_time (in %), LBGI, HBGI, GMI, daily risk maxima
+                max_rl and max_rh and their sum risk_range
+
+    """
+    if starts is None:
+        starts = day_starts(series.day)
+    index = pd.DatetimeIndex(series.day[starts].astype('datetime64[D]'), name='day')
+    if len(starts) == 0:
+        return pd.DataFrame(columns=DAILY_COLUMNS, index=index, dtype=float)
+
+    y = series.y.astype(float)
+    rl, rh = risk_space(y) if risk is None else risk
+    n = np.diff(np.r_[starts, len(y)])
+    mean = np.add.reduceat(y, starts) / n
+    sd = np.sqrt(np.maximum(np.add.reduceat(y*y, starts) / n - mean**2, 0))
+    max_rl = np.maximum.reduceat(rl, starts)
+    max_rh = np.maximum.reduceat(rh, starts)
+    return pd.DataFrame({
+        'n': n,
+        'mean': mean,
+        'sd': sd,
+        'CV': sd / mean * 100,
+        'time_in_range': np.add.reduceat((y >= 70) & (y <= 180), starts) / n * 100,
+        'hypo_time': np.add.reduceat(y < 70, starts) / n * 100,
+        'hyper_time': np.add.reduceat(y > 180, starts) / n * 100,
+        'LBGI': np.add.reduceat(rl, starts) / n,
+        'HBGI': np.add.reduceat(rh, starts) / n,
+        'GMI': gmi(mean),
+        'max_rl': max_rl,
+        'max_rh': max_rh,
+        'risk_range': max_rl + max_rh,
+    }, index=index)
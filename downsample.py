@@ -0,0 +1,66 @@
+import numpy as np
+
+
+def lttb(x, y, budget):
+    """
+        Largest-Triangle-Three-Buckets: keeps the first and last points and, from each of budget - 2
+        equal buckets in between, the point forming the largest triangle with the point kept in
+        the previous bucket and the mean of the next bucket, which preserves the visual shape
+        Args:
+            x (np.ndarray): sorted positions
+            y (np.ndarray): values aligned with x
+            budget (integer): number of points to keep
+        Returns:
+            index (np.ndarray): sorted positions of the kept points
+
+    """
+    n = len(x)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, budget - 1).astype(np.int64)
+    # mean of every bucket, the last "bucket" being the last point
+    counts = np.diff(np.r_[edges, n])
+    x_mean = np.add.reduceat(x, edges) / counts
+    y_mean = np.add.reduceat(y, edges) / counts
+
+    index = np.empty(budget, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - x_mean[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (y_mean[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        index[i + 1] = a
+    return index
+
+
+def downsample(x, y, budget=2000, low=70, high=180):
+    """
+        Reduces a series to about `budget` points for plotting with LTTB, adding back the lowest
+        value of each bucket below `low` and the highest above `high`, so no hypo or hyper
+        extreme disappears from the chart. The result never exceeds 3 x budget points, before
+        the gap points CgmMetric.scatter_points adds to it
+        Args:
+            x (np.ndarray): sorted positions (e.g. epoch seconds)
+            y (np.ndarray): glucose values aligned with x
+            budget (integer): number of LTTB points (default=2000)
+            low (float): hypoglycemia limit (default=70)
+            high (float): hyperglycemia limit (default=180)
+        Returns:
+            index (np.ndarray): sorted positions of the points to plot
+
+    """
+    n = len(x)
+    index = lttb(x, y, budget)
+    if len(index) == n:
+        return index
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, budget + 1).astype(np.int64)[:-1]
+    bucket = np.repeat(np.arange(budget), np.diff(np.r_[edges, n]))
+    # position of the minimum and maximum of each bucket, from one lexsort per direction
+    lowest = np.lexsort((y, bucket))[edges]
+    highest = np.lexsort((-y, bucket))[edges]
+    extremes = np.r_[lowest[y[lowest] < low], highest[y[highest] > high]]
+    return np.union1d(index, extremes)
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+# consensus definitions: name, threshold, True for values below it
+EPISODE_LEVELS = [
+    ('Hypo level 1', 70, True),
+    ('Hypo level 2', 54, True),
+    ('Hyper level 1', 180, False),
+    ('Hyper level 2', 250, False),
+]
+
+
+def runs(flag, ts, max_gap):
+    """
+        Run-length encodes a boolean series, also starting a new run after every sensor gap
+        Args:
+            flag (np.ndarray): boolean value of each reading, in time order
+            ts (np.ndarray): epoch seconds of each reading
+            max_gap (float): longest interval in seconds between readings of the same run
+        Returns:
+            starts (np.ndarray): position of the first reading of each run
+            ends (np.ndarray): position of the last reading of each run
+            after_gap (np.ndarray): True for the runs that start after a gap
+
+    """
+    if len(flag) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=bool)
+    gap = np.diff(ts) > max_gap
+    change = np.r_[True, (flag[1:] != flag[:-1]) | gap]
+    starts = np.flatnonzero(change)
+    ends = np.r_[starts[1:] - 1, len(flag) - 1]
+    after_gap = np.r_[False, gap][starts]
+    return starts, ends, after_gap
+
+
+def detect_episodes(series, threshold, below=True, min_duration=15, min_end=15, max_gap=None):
+    """
+        Finds the glycemic episodes of a series with the consensus rules: an episode starts with at
+        least `min_duration` minutes beyond the threshold and ends with at least `min_end` minutes
+        back on the other side of it, or at a sensor gap. Shorter excursions and recoveries inside
+        an episode are merged into it. Everything is one pass of run-length encoding and reduceat
+        Args:
+            series (CgmSeries): compact glucose series
+            threshold (float): glucose limit in mg/dL
+            below (bool): True for values below the threshold (hypo), False for above (hyper)
+            min_duration (float): minutes beyond the threshold that start an episode (default=15)
+            min_end (float): minutes back past the threshold that end an episode (default=15)
+            max_gap (float): longest interval in minutes without breaking a run (default=twice the median interval)
+        Returns:
+            df (pd.DataFrame): one row per episode with start, end, duration (minutes), readings,
+                extreme (nadir for hypo, peak for hyper) and mean
+
+    """
+    columns = ['start', 'end', 'duration', 'readings', 'extreme', 'mean']
+    ts, y = series.ts, series.y.astype(float)
+    if len(ts) < 2:
+        return pd.DataFrame(columns=columns)
+    # each reading stands for one sampling interval
+    interval = float(np.median(np.diff(ts)))
+    max_gap = 2*interval if max_gap is None else max_gap*60
+    beyond = y < threshold if below else y > threshold
+
+    starts, ends, after_gap = runs(beyond, ts, max_gap)
+    duration = (ts[ends] - ts[starts] + interval) / 60
+    inside = beyond[starts]
+    # a long enough run back past the threshold, or a gap, closes the episode in progress
+    closes = (~inside & (duration >= min_end)) | after_gap
+    group = np.cumsum(closes)
+    # an episode opens at the first long enough run beyond the threshold of its group
+    opens = inside & (duration >= min_duration)
+    first_open = np.full(group[-1] + 1, len(starts))
+    np.minimum.at(first_open, group[opens], np.flatnonzero(opens))
+    members = inside & (np.arange(len(starts)) >= first_open[group])
+    if not members.any():
+        return pd.DataFrame(columns=columns)
+
+    # the episode spans its member runs, with the short recoveries between them
+    member_group = group[members]
+    new_episode = np.r_[True, member_group[1:] != member_group[:-1]]
+    first = starts[members][new_episode]
+    last = ends[members][np.r_[new_episode[1:], True]]
+    span = np.zeros(len(y) + 1, dtype=np.int64)
+    np.add.at(span, first, 1)
+    np.add.at(span, last + 1, -1)
+    # readings between episodes fall in the reduceat segment of the episode before them, so they are masked
+    in_episode = np.cumsum(span[:-1]) > 0
+    episode_y = np.where(in_episode, y, np.nan)
+    extreme = (np.fmin if below else np.fmax).reduceat(episode_y, first)
+    total = np.add.reduceat(np.where(in_episode, y, 0), first)
+    readings = np.add.reduceat(in_episode, first)
+
+    return pd.DataFrame({
+        'start': pd.to_datetime(ts[first], unit='s'),
+        'end': pd.to_datetime(ts[last], unit='s'),
+        'duration': (ts[last] - ts[first] + interval) / 60,
+        'readings': readings,
+        'extreme': extreme,
+        'mean': total / readings,
+    })
+
+
+def episode_table(series, **options):
+    """
+        Detects the episodes of every consensus level of EPISODE_LEVELS
+        Args:
+            series (CgmSeries): compact glucose series
+            options: min_duration, min_end and max_gap of detect_episodes
+        Returns:
+            df (pd.DataFrame): episodes of all levels, with a level column first
+
+    """
+    tables = []
+    for name, threshold, below in EPISODE_LEVELS:
+        table = detect_episodes(series, threshold, below, **options)
+        table.insert(0, 'level', name)
+        tables.append(table)
+    found = [table for table in tables if len(table)]
+    return pd.concat(found, ignore_index=True) if found else tables[0]
+
+
+def episode_summary(table):
+    """
+        Summarizes an episode table per level
+        Args:
+            table (pd.DataFrame): output of episode_table
+        Returns:
+            df (pd.DataFrame): number of episodes, mean and total duration (minutes) and the lowest
+                nadir (hypo) or highest peak (hyper) per level
+
+    """
+    levels = [name for name, _, _ in EPISODE_LEVELS]
+    grouped = table.groupby('level')
+    summary = pd.DataFrame({
+        'episodes': grouped.size(),
+        'mean_duration': grouped['duration'].mean(),
+        'total_duration': grouped['duration'].sum(),
+        'lowest': grouped['extreme'].min(),
+        'highest': grouped['extreme'].max(),
+    }).reindex(levels)
+    below = np.array([below for _, _, below in EPISODE_LEVELS])
+    summary['extreme'] = np.where(below, summary['lowest'], summary['highest'])
+    summary['episodes'] = summary['episodes'].fillna(0).astype(int)
+    return summary.drop(columns=['lowest', 'highest'])
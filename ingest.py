@@ -0,0 +1,362 @@
+import csv
+import io
+from datetime import datetime
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# what a malformed upload can raise while it is read, as opposed to a bug in the reader
+PARSE_ERRORS = (ValueError, KeyError, pd.errors.ParserError) + ((pa.ArrowInvalid,) if pa is not None else ())
+
+# uploads larger than this are read in chunks by read_device_csv_chunked
+CHUNKED_BYTES = 64 * 2**20
+
+# layout of each export: line with the column names and words it contains, lines before the data
+# (minus one), column positions and known timestamp formats
+DEVICE_FORMATS = {
+    'Freestyle Libre': {
+        'delimiter': ',',
+        'header': 1,
+        'markers': ['device timestamp', 'historic glucose'],
+        'skiprows': 1,
+        'glucose': 4,
+        'timestamp': 2,
+        'formats': ['%m-%d-%Y %I:%M %p', '%d-%m-%Y %H:%M', '%m-%d-%Y %H:%M', '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M'],
+    },
+    'Dexcom': {
+        'delimiter': ',',
+        'header': 0,
+        'markers': ['timestamp', 'glucose value'],
+        'skiprows': 1,
+        'glucose': 7,
+        'timestamp': 1,
+        'formats': ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S'],
+    },
+    'Nightscout': {
+        'delimiter': ';',
+        'header': 1,
+        'markers': [],
+        'skiprows': 1,
+        'glucose': -2,
+        'timestamp': 3,
+        'formats': ['%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'],
+    },
+}
+
+
+class Sniff(NamedTuple):
+    """
+        Settings found by sniff for reading an export
+    """
+    device: str
+    timestamp_format: str
+    unit: str
+
+
+def head_lines(raw: bytes, nbytes=16 * 1024):
+    """
+        Decodes the complete lines found in the first bytes of a file
+        Args:
+            raw (bytes): content of the file
+            nbytes (integer): number of bytes to decode (default=16KB)
+        Returns:
+            lines (list): the first lines of the file
+
+    """
+    lines = raw[:nbytes].decode('utf-8-sig', errors='replace').splitlines()
+    if len(raw) > nbytes:
+        lines = lines[:-1]
+    return lines
+
+
+def header_fields(raw: bytes, spec):
+    """
+        Reads the header line of an export without decoding the rest of the file
+        Args:
+            raw (bytes): content of the file
+            spec (dict): entry of DEVICE_FORMATS
+        Returns:
+            fields (list): column names of the export
+
+    """
+    head = head_lines(raw, 64 * 1024)
+    if len(head) <= spec['header']:
+        raise ValueError('The file ends before its header')
+    return next(csv.reader([head[spec['header']]], delimiter=spec['delimiter']))
+
+
+def sniff(raw: bytes, device=None, nbytes=16 * 1024):
+    """
+        Identifies the device, timestamp format and unit of an export from its first bytes only
+        Args:
+            raw (bytes): content of the file
+            device (str): device selected by the user, or None to detect it
+            nbytes (integer): number of bytes to look at (default=16KB)
+        Returns:
+            sniff (Sniff): device, timestamp format (None when only inference works) and
+                unit ('mg/dL', 'mmol/L' or None when the sample has no glucose values)
+        Raises:
+            ValueError: when the file does not match the selected device, or any device
+
+    """
+    lines = head_lines(raw, nbytes)
+    candidates = [device] if device is not None else list(DEVICE_FORMATS)
+    for name in candidates:
+        if name not in DEVICE_FORMATS:
+            raise ValueError(f'Unknown device: {name}')
+        spec = DEVICE_FORMATS[name]
+        if len(lines) <= spec['skiprows'] + 1:
+            continue
+        header = next(csv.reader([lines[spec['header']]], delimiter=spec['delimiter']))
+        if not all(-len(header) <= spec[column] < len(header) for column in ('glucose', 'timestamp')):
+            continue
+        if device is None and not all(marker in lines[spec['header']].lower() for marker in spec['markers']):
+            continue
+        rows = [row for row in csv.reader(lines[spec['skiprows'] + 1:], delimiter=spec['delimiter']) if len(row) == len(header)]
+        timestamps = [row[spec['timestamp']] for row in rows if row[spec['timestamp']]]
+        glucose = pd.to_numeric(pd.Series([row[spec['glucose']] for row in rows], dtype=object), errors='coerce').dropna()
+        if not timestamps:
+            continue
+        timestamp_format = _sniff_format(timestamps, spec['formats'])
+        if timestamp_format is None:
+            try:
+                pd.to_datetime(pd.Series(timestamps))
+            except (ValueError, TypeError):
+                continue
+
+        column = header[spec['glucose']].lower()
+        if 'mmol' in column:
+            unit = 'mmol/L'
+        elif 'mg/dl' in column:
+            unit = 'mg/dL'
+        elif len(glucose):
+            unit = 'mmol/L' if np.median(glucose) < 40 else 'mg/dL'
+        else:
+            unit = None
+        return Sniff(name, timestamp_format, unit)
+    raise ValueError('The file does not match the layout of a supported device')
+
+
+def _sniff_format(timestamps, formats):
+    for fmt in formats:
+        try:
+            for value in timestamps:
+                datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+
+def parse_timestamps(values, formats):
+    """
+        Parses timestamps with the first explicit format that matches a sample of them,
+        falling back to pandas inference when none does
+        Args:
+            values (pd.Series): timestamps as strings
+            formats (list): candidate strftime formats
+        Returns:
+            ds (pd.Series): naive datetime64 timestamps, NaT where a value does not match
+
+    """
+    fmt = detect_format(values, formats)
+    if fmt is None:
+        return _wall_clock(values)
+    return _wall_clock(values, fmt, errors='coerce')
+
+
+def detect_format(values, formats):
+    """
+        Finds the first explicit format that matches a sample spread across the timestamps
+        Args:
+            values (pd.Series): timestamps as strings
+            formats (list): candidate strftime formats
+        Returns:
+            format (str): the matching format, or None when only inference works
+
+    """
+    sample = values.dropna()
+    sample = sample.iloc[::max(len(sample) // 200, 1)]
+    for fmt in formats:
+        try:
+            pd.to_datetime(sample, format=fmt, utc=True)
+        except (ValueError, TypeError):
+            continue
+        return fmt
+    return None
+
+
+def _wall_clock(values, fmt=None, errors='raise'):
+    """
+        Parses timestamps to the naive wall-clock time they were written in. Values with an offset
+        (e.g. a Nightscout dateString, whose offset changes with daylight saving time) are parsed to
+        UTC and moved by their own offset, as a single timezone cannot hold them
+        Args:
+            values (pd.Series): timestamps as strings
+            fmt (str): strftime format, None for pandas inference
+            errors (str): 'raise' or 'coerce', as in pd.to_datetime
+        Returns:
+            ds (pd.Series): naive datetime64 timestamps
+
+    """
+    ds = pd.to_datetime(values, format=fmt, errors=errors, utc=True).dt.tz_localize(None)
+    if fmt is not None and '%z' not in fmt:
+        return ds
+    # a trailing Z, or no offset at all, leaves the time as it is
+    offset = values.str.extract(r'([+-])(\d{2}):?(\d{2})$')
+    minutes = np.where(offset[0] == '-', -1, 1)*(offset[1].astype(float)*60 + offset[2].astype(float))
+    return ds + pd.to_timedelta(np.nan_to_num(minutes.to_numpy()), unit='min')
+
+
+def read_device_csv(raw: bytes, device: str, engine='auto', timestamp_format=None):
+    """
+        Reads only the glucose and timestamp columns of a device export
+        Args:
+            raw (bytes): content of the file
+            device (str): key of DEVICE_FORMATS
+            engine (str): 'pyarrow' for the multithreaded reader, 'c' for pandas, 'auto' for pyarrow when available
+            timestamp_format (str): format found by sniff, tried before the device formats
+        Returns:
+            df (pd.DataFrame): unsorted data with y (float) and ds (datetime64) columns
+        Raises:
+            ValueError: when the file does not match the device layout
+
+    """
+    spec, n_columns, glucose, timestamp = _layout(raw, device)
+    df = None
+    if engine != 'c' and pa is not None:
+        try:
+            df = _read_pyarrow(raw, spec, glucose, timestamp)
+        except (pa.ArrowInvalid, ValueError):
+            if engine == 'pyarrow':
+                raise ValueError(f'The file does not match a {device} export')
+    if df is None:
+        df = _read_pandas(raw, spec, n_columns, glucose, timestamp)
+
+    df['y'] = pd.to_numeric(df['y'], errors='coerce').astype(float)
+    formats = [timestamp_format] + spec['formats'] if timestamp_format else spec['formats']
+    df['ds'] = parse_timestamps(df['ds'], formats)
+    return df
+
+
+def read_device_csv_chunked(source, device: str, chunksize=500_000, timestamp_format=None):
+    """
+        Streams a device export in chunks, keeping only compact timestamp and glucose arrays
+        of each chunk, so the parsing memory does not grow with the width or length of the file
+        Args:
+            source (bytes or str): content of the file or path to it
+            device (str): key of DEVICE_FORMATS
+            chunksize (integer): number of rows parsed at a time (default=500000)
+            timestamp_format (str): format found by sniff, tried before the device formats
+        Returns:
+            df (pd.DataFrame): data sorted by ds, one row per timestamp, with y (float) and ds (datetime64) columns
+        Raises:
+            ValueError: when the file does not match the device layout
+
+    """
+    if isinstance(source, bytes):
+        head = source
+    else:
+        with open(source, 'rb') as f:
+            head = f.read(64 * 1024)
+    spec, n_columns, glucose, timestamp = _layout(head, device)
+    formats = [timestamp_format] + [fmt for fmt in spec['formats'] if fmt != timestamp_format] if timestamp_format else list(spec['formats'])
+    while True:
+        handle = io.BytesIO(source) if isinstance(source, bytes) else source
+        df, rejected = _read_chunks(handle, spec, n_columns, glucose, timestamp, chunksize, formats)
+        if df is not None:
+            return df
+        # the chunks read before the mismatch may have been misread as well (e.g. day-first dates
+        # up to the 12th parsed month-first), so the file is read again without the rejected format
+        formats.remove(rejected)
+
+
+def _read_chunks(handle, spec, n_columns, glucose, timestamp, chunksize, formats):
+    # the first chunk settles the format and every later chunk is checked against it, returning
+    # (None, format) as soon as a chunk's sample fits an earlier candidate or does not fit the format
+    fmt, settled = None, False
+    ds_parts, y_parts = [], []
+    try:
+        chunks = pd.read_csv(
+            handle,
+            delimiter=spec['delimiter'],
+            skiprows=spec['skiprows'] + 1,
+            header=None,
+            names=range(n_columns),
+            usecols=[glucose, timestamp],
+            dtype={timestamp: str},
+            chunksize=chunksize,
+        )
+        for chunk in chunks:
+            found = detect_format(chunk[timestamp], formats)
+            if not settled:
+                fmt, settled = found, True
+            elif found != fmt:
+                # of the two, the one later in formats failed on a sample it was checked against
+                later = found is None or (fmt is not None and formats.index(found) > formats.index(fmt))
+                return None, fmt if later else found
+            ds = _wall_clock(chunk[timestamp], fmt, errors='coerce')
+            ds = ds.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            y = pd.to_numeric(chunk[glucose], errors='coerce').to_numpy(dtype=float)
+            valid = (ds != np.iinfo(np.int64).min) & ~np.isnan(y)
+            ds, index = np.unique(ds[valid], return_index=True)
+            ds_parts.append(ds)
+            y_parts.append(y[valid][index])
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as error:
+        raise ValueError(str(error))
+
+    ds = np.concatenate(ds_parts) if ds_parts else np.empty(0, dtype=np.int64)
+    y = np.concatenate(y_parts) if y_parts else np.empty(0)
+    # repeated timestamps across chunk boundaries keep the first reading found
+    order = np.argsort(ds, kind='stable')
+    ds, y = ds[order], y[order]
+    first = np.concatenate([[True], ds[1:] != ds[:-1]]) if len(ds) else np.empty(0, dtype=bool)
+    return pd.DataFrame({'y': y[first], 'ds': ds[first].view('datetime64[ns]')}), None
+
+
+def _layout(raw, device):
+    if device not in DEVICE_FORMATS:
+        raise ValueError(f'Unknown device: {device}')
+    spec = DEVICE_FORMATS[device]
+    n_columns = len(header_fields(raw, spec))
+    for position in (spec['glucose'], spec['timestamp']):
+        if not -n_columns <= position < n_columns:
+            raise ValueError(f'The file has {n_columns} columns, which does not match a {device} export')
+    return spec, n_columns, spec['glucose'] % n_columns, spec['timestamp'] % n_columns
+
+
+def _read_pyarrow(raw, spec, glucose, timestamp):
+    names = {glucose: 'y', timestamp: 'ds'}
+    table = pa_csv.read_csv(
+        io.BytesIO(raw),
+        read_options=pa_csv.ReadOptions(skip_rows=spec['skiprows'] + 1, autogenerate_column_names=True),
+        parse_options=pa_csv.ParseOptions(delimiter=spec['delimiter']),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=[f'f{i}' for i in names],
+            column_types={f'f{timestamp}': pa.string()},
+        ),
+    )
+    table = table.rename_columns([names[int(name[1:])] for name in table.column_names])
+    return table.to_pandas()[['y', 'ds']]
+
+
+def _read_pandas(raw, spec, n_columns, glucose, timestamp):
+    try:
+        df = pd.read_csv(
+            io.BytesIO(raw),
+            delimiter=spec['delimiter'],
+            skiprows=spec['skiprows'] + 1,
+            header=None,
+            names=range(n_columns),
+            usecols=[glucose, timestamp],
+            dtype={timestamp: str},
+        )
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as error:
+        raise ValueError(str(error))
+    return df.rename(columns={glucose: 'y', timestamp: 'ds'})[['y', 'ds']]
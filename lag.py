@@ -0,0 +1,79 @@
+import numpy as np
+
+
+def lagged_differences(grid, hours=24, observed_only=True):
+    """
+        Computes the differences between each grid value and the value `hours` earlier,
+        which on a fixed-interval grid is a shift of the array by a whole number of slots
+        Args:
+            grid (Grid): output of resample.resample
+            hours (float): lag in hours (default=24)
+            observed_only (bool): ignore the interpolated slots (default=True)
+        Returns:
+            diff (np.ndarray): y minus the lagged y for every slot where both are known
+
+    """
+    lag = int(round(hours*3600 / grid.interval))
+    if lag <= 0 or lag >= len(grid.y):
+        return np.empty(0)
+    y = np.where(grid.observed, grid.y, np.nan) if observed_only else grid.y
+    diff = y[lag:] - y[:-lag]
+    return diff[~np.isnan(diff)]
+
+
+def grouped_lagged_differences(group, ts, y, intervals, hours=24):
+    """
+        Computes lagged_differences over the observed grid slots of every group at once: readings
+        are snapped to the slots of their group's interval and each slot is matched with the slot
+        `hours` earlier by binary search on the (group, slot) keys
+        Args:
+            group (np.ndarray): sorted group of each reading
+            ts (np.ndarray): epoch seconds, sorted within each group
+            y (np.ndarray): glucose values
+            intervals (np.ndarray): grid interval in seconds of each group
+            hours (float): lag in hours (default=24)
+        Returns:
+            diff_group (np.ndarray): group of each difference
+            diff (np.ndarray): y minus the lagged y, for every matched slot
+
+    """
+    if len(ts) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    interval = intervals[group]
+    key = (group.astype(np.int64) << 32) + np.rint(ts / interval).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    key = key[starts]
+    # readings that share a slot are averaged, as in resample
+    mean = np.add.reduceat(np.asarray(y, dtype=float), starts) / np.diff(np.r_[starts, len(ts)])
+    target = key - np.rint(hours*3600 / interval[starts]).astype(np.int64)
+    match = np.searchsorted(key, target).clip(0, len(key) - 1)
+    found = key[match] == target
+    return group[starts][found], mean[found] - mean[match[found]]
+
+
+def modd(diff):
+    """
+        Computes the mean of daily differences from 24h-lagged differences
+        Args:
+            diff (np.ndarray): output of lagged_differences with hours=24
+        Returns:
+            MODD (float): Mean of daily differences
+
+    """
+    if len(diff) == 0:
+        return np.nan
+    return np.abs(diff).mean()
+
+
+def conga(diff):
+    """
+        Computes the continuous overall net glycemic action from n-hour lagged differences
+        Args:
+            diff (np.ndarray): output of lagged_differences with hours=n
+        Returns:
+            CONGA (float): standard deviation of the lagged differences
+
+    """
+    if len(diff) < 2:
+        return np.nan
+    return np.std(diff, ddof=1)
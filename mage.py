@@ -0,0 +1,145 @@
+import numpy as np
+
+
+def excursion_points(y):
+    """
+        Finds the local peaks and nadirs of a glucose series
+        Args:
+            y (np.ndarray): glucose values ordered by time
+        Returns:
+            index (np.ndarray): positions of the peaks and nadirs, in time order
+            is_peak (np.ndarray): True for peaks, False for nadirs
+
+    """
+    y = np.asarray(y, dtype=float)
+    if len(y) < 3:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    curvature = np.diff(np.sign(np.diff(y)))
+    index = np.flatnonzero(curvature != 0) + 1
+    is_peak = curvature[index - 1] < 0
+    return index, is_peak
+
+
+def current_mage(y, std=1):
+    """
+        Array version of the original Glucodash MAGE algorithm. Peaks and nadirs are
+        paired with the glucose values of the first rows of the series (the row counter
+        was used as position), and turning points are selected by comparing each
+        excursion point with the one `std` positions ahead.
+        Args:
+            y (np.ndarray): glucose values ordered by time
+            std (integer): offset between compared excursion points (default=1)
+        Returns:
+            MAGE (float): the mean amplitude of y excursions
+
+    """
+    y = np.asarray(y, dtype=float)
+    index, is_peak = excursion_points(y)
+    # the original table stored every peak first and every nadir after, taking y by row counter
+    order = np.concatenate([np.flatnonzero(is_peak), np.flatnonzero(~is_peak)])
+    values = np.empty(len(index))
+    values[order] = y[:len(index)]
+
+    length = len(index)
+    count = max(length - std, 0)
+    a = np.arange(count)
+    b = a + std
+    same_type = is_peak[a] == is_peak[b]
+    chosen = np.where(is_peak[a] | (values[a] > values[b]), b, a)
+    # pairs (i-std, i) and (i, i+std) for i in [std, length-std)
+    first = same_type & (a <= length - 2 * std - 1)
+    second = same_type & (a >= std)
+    n_turning = int(first.sum() + second.sum())
+
+    if n_turning < 10:
+        turning = np.arange(length)
+        excursion_count = length
+    else:
+        turning = np.unique(chosen[first | second])
+        excursion_count = length / 2
+
+    if excursion_count == 0:
+        return np.nan
+    mage = values[turning].sum() / excursion_count
+    return round(mage, 3)
+
+
+def service_mage(y, std=1):
+    """
+        Classic MAGE (Service et al., 1970). Turning points are reduced to the swings
+        larger than `std` standard deviations of the series, and the amplitudes of the
+        swings going in the direction of the first one are averaged.
+        Args:
+            y (np.ndarray): glucose values ordered by time
+            std (float): number of standard deviations an excursion must exceed (default=1)
+        Returns:
+            MAGE (float): the mean amplitude of y excursions
+
+    """
+    y = np.asarray(y, dtype=float)
+    if len(y) < 3:
+        return np.nan
+    threshold = std * np.std(y, ddof=1)
+
+    # drop repeated values so plateaus do not hide turning points
+    y = y[np.concatenate([[True], np.diff(y) != 0])]
+    if len(y) < 2:
+        return np.nan
+    slope = np.sign(np.diff(y))
+    turns = np.flatnonzero(slope[1:] != slope[:-1]) + 1
+    v = y[np.concatenate([[0], turns, [len(y) - 1]])].tolist()
+
+    # zig-zag through the turning points, confirming a swing once it is reversed by more than the threshold
+    pivots = []
+    low = high = 0
+    trend = 0
+    extreme = 0
+    for i in range(1, len(v)):
+        if trend == 0:
+            if v[i] < v[low]:
+                low = i
+            if v[i] > v[high]:
+                high = i
+            if v[i] - v[low] > threshold:
+                pivots.append(v[low])
+                trend, extreme = 1, i
+            elif v[high] - v[i] > threshold:
+                pivots.append(v[high])
+                trend, extreme = -1, i
+        elif trend == 1:
+            if v[i] > v[extreme]:
+                extreme = i
+            elif v[extreme] - v[i] > threshold:
+                pivots.append(v[extreme])
+                trend, extreme = -1, i
+        else:
+            if v[i] < v[extreme]:
+                extreme = i
+            elif v[i] - v[extreme] > threshold:
+                pivots.append(v[extreme])
+                trend, extreme = 1, i
+    if trend == 0:
+        return np.nan
+    pivots.append(v[extreme])
+
+    swings = np.diff(pivots)
+    direction = swings[0] > 0
+    mage = np.abs(swings[(swings > 0) == direction]).mean()
+    return round(mage, 3)
+
+
+def mage(y, std=1, algorithm='current'):
+    """
+        Computes the mean amplitude of glycemic excursions with the chosen algorithm
+        Args:
+            y (np.ndarray): glucose values ordered by time
+            std (integer): see current_mage and service_mage (default=1)
+            algorithm (str): 'current' for the original Glucodash method or 'service' for the classic one
+        Returns:
+            MAGE (float): the mean amplitude of y excursions
+
+    """
+    algorithms = {'current': current_mage, 'service': service_mage}
+    if algorithm not in algorithms:
+        raise ValueError(f'Unknown MAGE algorithm: {algorithm}')
+    return algorithms[algorithm](y, std)
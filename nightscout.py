@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from series import CgmSeries
+
+# one keep-alive session per site at module level, so connections survive Streamlit reruns
+_sessions = {}
+_lock = threading.Lock()
+
+
+def session_for(url, retries=5, backoff=0.5, pool_size=4):
+    """
+        Returns the pooled session of a Nightscout site, retrying failed GETs with exponential backoff
+        Args:
+            url (str): base URL of the site
+            retries (integer): attempts after the first one (default=5)
+            backoff (float): backoff factor in seconds (default=0.5)
+            pool_size (integer): connections kept alive (default=4)
+        Returns:
+            session (requests.Session): the shared session
+
+    """
+    with _lock:
+        session = _sessions.get(url)
+        if session is None:
+            retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(['GET']), respect_retry_after_header=True)
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[url] = session
+        return session
+
+
+class NightscoutClient:
+    """
+        Pulls the glucose entries of a Nightscout site into a ReadingStore, remembering the date of
+        the last synced entry so that each sync only transfers the entries added since
+    """
+
+    def __init__(self, url, store, token=None, api_secret=None, page_size=10000, timeout=30, overlap=3):
+        self.url = url.rstrip('/')
+        self.store = store
+        self.token = token
+        self.headers = {'Accept': 'application/json'}
+        if api_secret:
+            self.headers['api-secret'] = hashlib.sha1(api_secret.encode()).hexdigest()
+        self.page_size = page_size
+        self.timeout = timeout
+        # hours fetched again before the cursor, for entries a device uploads late with older dates
+        self.overlap = overlap
+        self.session = session_for(self.url)
+
+    @property
+    def state_path(self):
+        return self.store.path / 'nightscout.json'
+
+    def cursor(self):
+        """
+            Returns the date (epoch milliseconds, UTC) of the last entry synced from this site, None before the first sync
+        """
+        if not self.state_path.exists():
+            return None
+        with open(self.state_path) as f:
+            state = json.load(f)
+        return state.get(self.url)
+
+    def _save_cursor(self, date):
+        with self.store.lock():
+            self._write_cursor(date)
+
+    def _write_cursor(self, date):
+        state = {}
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                state = json.load(f)
+        state[self.url] = int(date)
+        with tempfile.NamedTemporaryFile('w', dir=self.state_path.parent, suffix='.tmp', delete=False) as tmp:
+            json.dump(state, tmp)
+        try:
+            os.replace(tmp.name, self.state_path)
+        except OSError:
+            os.unlink(tmp.name)
+            raise
+
+    def entries(self, after=None):
+        """
+            Pages through /api/v1/entries from the newest entry back to `after`. The API returns the
+            newest entries first, so each page asks for the entries up to the oldest date of the
+            previous one, inclusive so that entries sharing that date are not cut off, and drops
+            the entries already returned
+            Args:
+                after (integer): epoch milliseconds, exclusive (None for the whole history)
+            Returns:
+                pages (generator): lists of entry dicts, newest first
+
+        """
+        before = None
+        seen = set()
+        while True:
+            params = {'count': self.page_size, 'find[type]': 'sgv'}
+            if after is not None:
+                params['find[date][$gt]'] = after
+            if before is not None:
+                params['find[date][$lte]'] = before
+            if self.token:
+                params['token'] = self.token
+            response = self.session.get(f'{self.url}/api/v1/entries.json', params=params,
+                                        headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            page = response.json()
+            new = [entry for entry in page if entry_key(entry) not in seen]
+            if not new:
+                return
+            seen.update(entry_key(entry) for entry in new)
+            yield new
+            if len(page) < self.page_size:
+                return
+            before = min(entry['date'] for entry in page)
+
+    def sync(self):
+        """
+            Fetches the entries added since the last sync, plus the `overlap` hours before it for
+            late backfills, and merges them into the store, which drops the readings it already has.
+            The cursor only moves after the merge, so an interrupted sync is simply repeated
+            Returns:
+                added (int): number of new readings stored
+
+        """
+        cursor = self.cursor()
+        after = None if cursor is None else cursor - int(self.overlap*3600*1000)
+        pages = [to_frame(page) for page in self.entries(after)]
+        if not pages:
+            return 0
+        df = pd.concat(pages, ignore_index=True)
+        if df.empty:
+            return 0
+        added = self.store.merge(to_series(df))
+        self._save_cursor(max(df['date'].max(), cursor or 0))
+        return added
+
+
+def entry_key(entry):
+    # the database id when the site returns it, else the reading itself
+    return entry.get('_id') or (entry.get('date'), entry.get('sgv'))
+
+
+def to_frame(entries):
+    """
+        Keeps the sensor glucose entries of an API page
+        Args:
+            entries (list): entry dicts from /api/v1/entries
+        Returns:
+            df (pd.DataFrame): date (epoch milliseconds, UTC), utcOffset (minutes) and sgv (mg/dL) columns
+
+    """
+    df = pd.DataFrame(entries, columns=['type', 'date', 'utcOffset', 'sgv'])
+    df = df[(df['type'].fillna('sgv') == 'sgv') & df['sgv'].notna() & df['date'].notna()]
+    return pd.DataFrame({
+        'date': df['date'].astype(np.int64),
+        'utcOffset': pd.to_numeric(df['utcOffset'], errors='coerce').fillna(0).astype(np.int64),
+        'sgv': df['sgv'].astype(float),
+    })
+
+
+def to_series(df):
+    """
+        Builds a CgmSeries on the uploader's wall clock, like the exported files
+        Args:
+            df (pd.DataFrame): output of to_frame
+        Returns:
+            series (CgmSeries): the readings in time order, one per timestamp
+
+    """
+    ts = df['date'].to_numpy() // 1000 + df['utcOffset'].to_numpy()*60
+    y = df['sgv'].to_numpy()
+    ts, first = np.unique(ts, return_index=True)
+    return CgmSeries(ts, y[first])
@@ -0,0 +1,117 @@
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from mage import mage
+from lag import grouped_lagged_differences
+from resample import group_sampling_intervals
+from risk import risk_space
+from daily import daily_table
+from report import MetricsReport, segment_quantile, sort_within, gmi, ea1c, j_index
+
+
+class PeriodComparison(NamedTuple):
+    """
+        Metrics of the current period next to those of the periods before it, as returned by compare_periods
+    """
+    current: MetricsReport
+    previous: tuple
+    deltas: tuple
+
+
+def compare_periods(series, edges, stats=None):
+    """
+        Computes the CgmMetric.compute_all panel of consecutive periods together: the readings are
+        labelled by period and the panel of every label comes from one group_metrics pass, so
+        comparing with N earlier periods costs one pass instead of N + 1 CgmMetric instances
+        Args:
+            series (CgmSeries): filtered readings covering the periods
+            edges (list): ascending epoch seconds; period i holds edges[i] < ts <= edges[i + 1]
+                and the last period is the current one
+            stats (list): SufficientStats of each period in the same order (e.g. from StatsCube.query),
+                computed from the readings when None
+        Returns:
+            comparison (PeriodComparison): current report, previous reports and current minus
+                each previous report, most recent first
+
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    n_periods = len(edges) - 1
+    bounds = np.searchsorted(series.ts, edges, side='right')
+    series = series.take(slice(bounds[0], bounds[-1]))
+    label = np.repeat(np.arange(n_periods), np.diff(bounds))
+
+    panel = group_metrics(series, label, n_periods, stats)
+    reports = [MetricsReport(*row) for row in panel.itertuples(index=False)]
+    current = reports[-1]
+    previous = tuple(reversed(reports[:-1]))
+    deltas = tuple(MetricsReport(*(a - b for a, b in zip(current, report))) for report in previous)
+    return PeriodComparison(current, previous, deltas)
+
+
+def group_metrics(series, group, n_groups, stats=None):
+    """
+        Computes the CgmMetric.compute_all panel of every group of a grouped series in one pass.
+        Every metric is a bincount or reduceat over the group labels (the daily ones over the
+        (group, day) runs); only MAGE, which walks the readings in order, loops over the groups
+        Args:
+            series (CgmSeries): readings sorted by group, then time
+            group (np.ndarray): group of each reading, from 0 to n_groups - 1 and contiguous
+            n_groups (integer): number of groups, including those without readings
+            stats (list): SufficientStats of each group overriding the additive statistics (optional)
+        Returns:
+            df (pd.DataFrame): one row per group with the MetricsReport fields as columns, rounded as
+                CgmMetric rounds them (NaN and available_data=0 for groups without readings)
+
+    """
+    y = series.y.astype(float)
+    counts = np.bincount(group, minlength=n_groups)
+    bounds = np.r_[0, np.cumsum(counts)]
+    if stats is None:
+        n, total, sum_sq = counts, np.bincount(group, weights=y, minlength=n_groups), np.bincount(group, weights=y*y, minlength=n_groups)
+        n_hypo = np.bincount(group, weights=y < 70, minlength=n_groups)
+        n_range = np.bincount(group, weights=(y >= 70) & (y <= 180), minlength=n_groups)
+        n_hyper = np.bincount(group, weights=y > 180, minlength=n_groups)
+    else:
+        n, total, sum_sq, n_hypo, n_range, n_hyper = (np.array(column, dtype=float) for column in list(zip(*stats))[:6])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / n
+        ss = np.maximum(sum_sq - total*mean, 0)
+        std = np.sqrt(ss / n)
+
+        # quartiles from one sort of the values within each group
+        sorted_y = sort_within(group, series.y).astype(float)
+        q1, q3 = (segment_quantile(sorted_y, bounds, q) for q in (0.25, 0.75))
+
+        # risk indices, and the daily table of each (group, day) run for the intraday SD and ADRR
+        rl, rh = risk_space(y)
+        starts = np.flatnonzero(np.r_[True, (series.day[1:] != series.day[:-1]) | (group[1:] != group[:-1])]) if len(y) else np.empty(0, dtype=np.int64)
+        daily = daily_table(series, starts, (rl, rh))
+        n_days = np.bincount(group[starts], minlength=n_groups)
+
+        diff_group, diff = grouped_lagged_differences(group, series.ts, series.y, group_sampling_intervals(group, series.ts, n_groups))
+        n_diff = np.bincount(diff_group, minlength=n_groups)
+        diff_total = np.bincount(diff_group, weights=diff, minlength=n_groups)
+        diff_ss = np.maximum(np.bincount(diff_group, weights=diff*diff, minlength=n_groups) - diff_total**2 / n_diff, 0)
+
+        panel = pd.DataFrame({
+            'available_data': n.astype(np.int64),
+            'average_glucose': np.round(mean),
+            'sd': np.round(np.sqrt(ss / (n - 1)), 2),
+            'eA1c': ea1c(mean),
+            'time_in_range': np.round(n_range / n * 100, 2),
+            'hyper_time': np.round(n_hyper / n * 100, 2),
+            'hypo_time': np.round(n_hypo / n * 100, 2),
+            'inter_qr': q3 - q1,
+            'interdaysd': std,
+            'intradaysd': np.bincount(group[starts], weights=daily['sd'], minlength=n_groups) / n_days,
+            'MAGE': [mage(series.y[bounds[i]:bounds[i + 1]]) if counts[i] else np.nan for i in range(n_groups)],
+            'J_index': j_index(mean, std),
+            'LBGI': np.bincount(group, weights=rl, minlength=n_groups) / counts,
+            'HBGI': np.bincount(group, weights=rh, minlength=n_groups) / counts,
+            'ADRR': np.bincount(group[starts], weights=daily['risk_range'], minlength=n_groups) / n_days,
+            'MODD': np.bincount(diff_group, weights=np.abs(diff), minlength=n_groups) / n_diff,
+            'CONGA24': np.where(n_diff >= 2, np.sqrt(diff_ss / (n_diff - 1)), np.nan),
+            'GMI': gmi(mean),
+        })
+    return panel
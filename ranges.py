@@ -0,0 +1,47 @@
+import numpy as np
+
+# glucose tiers: limits starting a tier at y >= limit, limits ending one at y <= limit, names and colors
+RANGE_TIERS = {
+    'standard': {
+        'low': (70,),
+        'high': (180,),
+        'names': ['Hypoglicemia', 'In range', 'Hyperglicemia'],
+        'colors': ['#f54266', '#38cf77', '#4287f5'],
+    },
+    'extended': {
+        'low': (54, 70),
+        'high': (180, 250),
+        'names': ['Very low (<54)', 'Low (54-69)', 'In range (70-180)', 'High (181-250)', 'Very high (>250)'],
+        'colors': ['#b3173a', '#f54266', '#38cf77', '#4287f5', '#1c4fa1'],
+    },
+}
+
+
+def tier_of(y, tiers='standard'):
+    """
+        Finds the glucose tier of each value
+        Args:
+            y (np.ndarray): glucose values in mg/dL
+            tiers (str): key of RANGE_TIERS (default='standard')
+        Returns:
+            tier (np.ndarray): index of the tier of each value, in the order of RANGE_TIERS[tiers]['names']
+
+    """
+    spec = RANGE_TIERS[tiers]
+    y = np.asarray(y, dtype=float)
+    return np.searchsorted(spec['low'], y, side='right') + np.searchsorted(spec['high'], y, side='left')
+
+
+def weekday_ranges(series, tiers='standard'):
+    """
+        Counts the readings of each weekday in each glucose tier with a single bincount
+        Args:
+            series (CgmSeries): compact glucose series
+            tiers (str): key of RANGE_TIERS (default='standard')
+        Returns:
+            counts (np.ndarray): (7, tiers) counts, Monday first
+
+    """
+    n_tiers = len(RANGE_TIERS[tiers]['names'])
+    key = series.weekday.astype(np.int64)*n_tiers + tier_of(series.y, tiers)
+    return np.bincount(key, minlength=7*n_tiers).reshape(7, n_tiers)
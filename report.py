@@ -0,0 +1,149 @@
+from typing import NamedTuple
+import numpy as np
+
+
+class SufficientStats(NamedTuple):
+    """
+        Statistics shared by the CgmMetric summary metrics, computed in one pass over y
+    """
+    n: int
+    total: float
+    sum_sq: float
+    n_hypo: int
+    n_range: int
+    n_hyper: int
+    sorted_y: np.ndarray
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else np.nan
+
+    def var(self, ddof=0):
+        if self.n - ddof <= 0:
+            return np.nan
+        return max(self.sum_sq - self.total**2 / self.n, 0) / (self.n - ddof)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.var(ddof))
+
+    def quantile(self, q):
+        return quantile(self.sorted_y, q)
+
+
+class MetricsReport(NamedTuple):
+    """
+        Full panel of CgmMetric results, as returned by CgmMetric.compute_all
+    """
+    available_data: int
+    average_glucose: float
+    sd: float
+    eA1c: float
+    time_in_range: float
+    hyper_time: float
+    hypo_time: float
+    inter_qr: float
+    interdaysd: float
+    intradaysd: float
+    MAGE: float
+    J_index: float
+    LBGI: float
+    HBGI: float
+    ADRR: float
+    MODD: float
+    CONGA24: float
+    GMI: float
+
+
+def sufficient_stats(y):
+    """
+        Computes the count, sums, range counts and sorted values of a glucose series
+        Args:
+            y (np.ndarray): glucose values in mg/dL
+        Returns:
+            stats (SufficientStats): statistics every summary metric is derived from
+
+    """
+    y = np.asarray(y, dtype=float)
+    return SufficientStats(
+        n=len(y),
+        total=y.sum(),
+        sum_sq=np.dot(y, y),
+        n_hypo=int(np.count_nonzero(y < 70)),
+        n_range=int(np.count_nonzero((y >= 70) & (y <= 180))),
+        n_hyper=int(np.count_nonzero(y > 180)),
+        sorted_y=np.sort(y),
+    )
+
+
+def quantile(sorted_y, q):
+    """
+        Computes a quantile of already sorted values with linear interpolation, as np.percentile does
+        Args:
+            sorted_y (np.ndarray): values sorted in ascending order
+            q (float): quantile between 0 and 1
+        Returns:
+            quantile (float): the interpolated quantile
+
+    """
+    if len(sorted_y) == 0:
+        return np.nan
+    h = (len(sorted_y) - 1) * q
+    lo = int(np.floor(h))
+    hi = min(lo + 1, len(sorted_y) - 1)
+    return sorted_y[lo] + (h - lo) * (sorted_y[hi] - sorted_y[lo])
+
+
+def segment_quantile(sorted_y, bounds, q):
+    """
+        Computes a quantile of each sorted segment sorted_y[bounds[i]:bounds[i + 1]] at once, as quantile does
+        Args:
+            sorted_y (np.ndarray): values sorted in ascending order within each segment
+            bounds (np.ndarray): start of each segment followed by the end of the last one
+            q (float): quantile between 0 and 1
+        Returns:
+            quantiles (np.ndarray): one interpolated quantile per segment, NaN for empty segments
+
+    """
+    n = np.diff(bounds)
+    h = (n - 1) * q
+    lo = np.floor(h).astype(np.int64)
+    hi = np.minimum(lo + 1, n - 1)
+    values = np.full(len(n), np.nan)
+    present = n > 0
+    start = bounds[:-1][present]
+    low = sorted_y[start + lo[present]]
+    values[present] = low + (h[present] - lo[present]) * (sorted_y[start + hi[present]] - low)
+    return values
+
+
+def sort_within(group, values):
+    """
+        Sorts float32 values within each group of a contiguous, ascending grouping. The float bits are
+        mapped to integers of the same order and packed below the group number into one int64 key,
+        so one plain sort replaces a much slower lexsort
+        Args:
+            group (np.ndarray): non-negative group of each value, ascending
+            values (np.ndarray): float32 values
+        Returns:
+            sorted_values (np.ndarray): float32 values in ascending order within each group
+
+    """
+    bits = np.asarray(values, dtype=np.float32).view(np.int32).astype(np.int64)
+    bits ^= (bits >> 31) & 0x7fffffff
+    key = (np.asarray(group, dtype=np.int64) << 32) + bits + 2**31
+    key.sort()
+    bits = (key & 0xffffffff) - 2**31
+    bits ^= (bits >> 31) & 0x7fffffff
+    return bits.astype(np.int32).view(np.float32)
+
+
+def gmi(mean):
+    return 3.31 + (0.02392*mean)
+
+
+def ea1c(mean):
+    return (46.7 + mean) / 28.7
+
+
+def j_index(mean, sd):
+    return 0.001*((mean + sd)**2)
@@ -0,0 +1,108 @@
+from typing import NamedTuple
+import numpy as np
+from report import segment_quantile
+
+
+class Grid(NamedTuple):
+    """
+        Glucose on a fixed-interval grid anchored at the epoch, as returned by resample
+    """
+    start: int
+    interval: int
+    y: np.ndarray
+    observed: np.ndarray
+
+    @property
+    def ts(self):
+        return self.start + np.arange(len(self.y), dtype=np.int64)*self.interval
+
+    @property
+    def valid(self):
+        return ~np.isnan(self.y)
+
+    def wear(self, start=None, end=None):
+        """
+            Computes the sensor wear: the share of grid slots with a reading
+            Args:
+                start (integer): epoch seconds, exclusive (None for the first slot)
+                end (integer): epoch seconds, inclusive (None for the last slot)
+            Returns:
+                wear (float): percentage of the slots of the window that were observed
+
+        """
+        lo = 0 if start is None else int(np.clip((start - self.start) // self.interval + 1, 0, len(self.y)))
+        hi = len(self.y) if end is None else int(np.clip((end - self.start) // self.interval + 1, 0, len(self.y)))
+        if hi <= lo:
+            return np.nan
+        return self.observed[lo:hi].mean()*100
+
+
+def sampling_interval(ts):
+    """
+        Infers the sampling interval of a device from its readings
+        Args:
+            ts (np.ndarray): sorted epoch seconds
+        Returns:
+            interval (int): median interval rounded to whole minutes, in seconds (at least one minute)
+
+    """
+    if len(ts) < 2:
+        return 300
+    return max(int(round(np.median(np.diff(ts)) / 60)), 1)*60
+
+
+def group_sampling_intervals(group, ts, n_groups):
+    """
+        Infers the sampling interval of every group of a grouped series at once, as sampling_interval does
+        Args:
+            group (np.ndarray): sorted group of each reading
+            ts (np.ndarray): epoch seconds, sorted within each group
+            n_groups (integer): number of groups
+        Returns:
+            intervals (np.ndarray): int64 interval in seconds of each group (300 for groups with fewer than two readings)
+
+    """
+    same = group[1:] == group[:-1]
+    # gaps packed below their group into one int64 key; a single sort orders them within each group
+    key = (group[1:][same].astype(np.int64) << 32) + np.minimum(np.diff(ts)[same], 2**32 - 1)
+    key.sort()
+    bounds = np.searchsorted(key >> 32, np.arange(n_groups + 1))
+    median = segment_quantile((key & 0xffffffff).astype(float), bounds, 0.5)
+    intervals = np.maximum(np.rint(median / 60), 1)*60
+    return np.where(np.isnan(median), 300, intervals).astype(np.int64)
+
+
+def resample(series, interval=None, max_gap=30):
+    """
+        Snaps readings onto the slots round(ts / interval) of a fixed grid, averaging the readings
+        that share a slot, leaving NaN where the sensor was off and interpolating linearly across
+        gaps of at most max_gap minutes. Slot k of any grid with the same interval is the same
+        instant, so lagged values are plain array shifts
+        Args:
+            series (CgmSeries): compact glucose series
+            interval (integer): grid interval in seconds (default=sampling_interval of the series)
+            max_gap (float): longest gap in minutes filled by interpolation (default=30, 0 for none)
+        Returns:
+            grid (Grid): grid start and interval, glucose with NaN gaps and the mask of observed slots
+
+    """
+    if interval is None:
+        interval = sampling_interval(series.ts)
+    if len(series) == 0:
+        return Grid(0, interval, np.empty(0), np.empty(0, dtype=bool))
+    slot = np.rint(series.ts / interval).astype(np.int64)
+    index = slot - slot[0]
+    n_slots = int(index[-1]) + 1
+    count = np.bincount(index, minlength=n_slots)
+    observed = count > 0
+    y = np.full(n_slots, np.nan)
+    y[observed] = np.bincount(index, weights=series.y.astype(float), minlength=n_slots)[observed] / count[observed]
+
+    position = np.flatnonzero(observed)
+    if max_gap and len(position) > 1:
+        # length of the gap around each slot, from the observed slots before and after it
+        after = np.searchsorted(position, np.arange(n_slots)).clip(1, len(position) - 1)
+        gap = position[after] - position[after - 1] - 1
+        fill = ~observed & (gap*interval <= max_gap*60)
+        y[fill] = np.interp(np.flatnonzero(fill), position, y[position])
+    return Grid(int(slot[0])*interval, interval, y, observed)
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def risk_space(y):
+    """
+        Transforms glucose values to the symmetric risk space of Kovatchev et al. in a single pass
+        Args:
+            y (np.ndarray): glucose values in mg/dL
+        Returns:
+            rl (np.ndarray): low blood glucose risk of each value (0 above the risk-space center)
+            rh (np.ndarray): high blood glucose risk of each value (0 below the risk-space center)
+
+    """
+    f = (np.log(np.asarray(y, dtype=float))**1.084) - 5.381
+    r = 22.77*(f**2)
+    rl = np.where(f <= 0, r, 0.0)
+    rh = np.where(f > 0, r, 0.0)
+    return rl, rh
+
+
+def lbgi(rl):
+    """
+        Computes the low blood glucose index from the low risk values
+        Args:
+            rl (np.ndarray): low risk values from risk_space
+        Returns:
+            LBGI (float): Low blood glucose index
+
+    """
+    return np.mean(rl)
+
+
+def hbgi(rh):
+    """
+        Computes the high blood glucose index from the high risk values
+        Args:
+            rh (np.ndarray): high risk values from risk_space
+        Returns:
+            HBGI (float): High blood glucose index
+
+    """
+    return np.mean(rh)
+
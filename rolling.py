@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from report import gmi
+
+
+def daily_sums(series):
+    """
+        Sums the additive statistics of a series per calendar day, including the days without readings
+        Args:
+            series (CgmSeries): compact glucose series
+        Returns:
+            days (np.ndarray): datetime64[D] of every day from the first to the last reading
+            sums (np.ndarray): (6, days) count, sum, sum of squares, hypo, in range and hyper counts
+
+    """
+    if len(series) == 0:
+        return np.empty(0, dtype='datetime64[D]'), np.zeros((6, 0))
+    day = series.day - series.day[0]
+    n_days = int(day[-1]) + 1
+    y = series.y.astype(float)
+    sums = np.stack([
+        np.bincount(day, minlength=n_days),
+        np.bincount(day, weights=y, minlength=n_days),
+        np.bincount(day, weights=y*y, minlength=n_days),
+        np.bincount(day, weights=y < 70, minlength=n_days),
+        np.bincount(day, weights=(y >= 70) & (y <= 180), minlength=n_days),
+        np.bincount(day, weights=y > 180, minlength=n_days),
+    ])
+    days = (series.day[0] + np.arange(n_days)).astype('datetime64[D]')
+    return days, sums
+
+
+def rolling_metrics(series, days=14, min_readings=1):
+    """
+        Computes the metrics of the trailing window of `days` calendar days ending on each day,
+        from running sums of the daily statistics, in one O(n + days) pass whatever the window
+        Args:
+            series (CgmSeries): compact glucose series
+            days (integer): length of the window in days (default=14)
+            min_readings (integer): windows with fewer readings are NaN (default=1)
+        Returns:
+            df (pd.DataFrame): one row per day with n, mean, sd, CV, GMI, time_in_range,
+                hypo_time and hyper_time columns (times in %)
+
+    """
+    day_index, sums = daily_sums(series)
+    running = np.zeros((6, sums.shape[1] + 1))
+    np.cumsum(sums, axis=1, out=running[:, 1:])
+    end = np.arange(1, sums.shape[1] + 1)
+    n, total, sum_sq, n_hypo, n_range, n_hyper = running[:, end] - running[:, np.maximum(end - days, 0)]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(n >= max(min_readings, 1), n, np.nan)
+        mean = total / n
+        ss = np.maximum(sum_sq - total*mean, 0)
+        df = pd.DataFrame({
+            'n': n,
+            'mean': mean,
+            'sd': np.sqrt(ss / (n - 1)),
+            'CV': np.sqrt(ss / n) / mean * 100,
+            'GMI': gmi(mean),
+            'time_in_range': n_range / n * 100,
+            'hypo_time': n_hypo / n * 100,
+            'hyper_time': n_hyper / n * 100,
+        }, index=pd.DatetimeIndex(day_index, name='day'))
+    return df
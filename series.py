@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from cache import array_key
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+class CgmSeries:
+    """
+        Compact glucose series sorted by time. Timestamps are int64 seconds since the epoch
+        (in the device's local time), glucose is float32 and the calendar fields are small
+        integers, so no per-row strings are kept. Labels are only built for display.
+    """
+
+    __slots__ = ('ts', 'y', 'day', 'weekday', 'minute')
+
+    def __init__(self, ts, y):
+        self.ts = np.asarray(ts, dtype=np.int64)
+        self.y = np.asarray(y, dtype=np.float32)
+        day = self.ts // 86400
+        # day ordinal since 1970-01-01, a Thursday
+        self.day = day.astype(np.int32)
+        self.weekday = ((day + 3) % 7).astype(np.int8)
+        self.minute = ((self.ts % 86400) // 60).astype(np.int16)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+            Builds a series from a dataframe with ds and y columns
+            Args:
+                df (pd.DataFrame): data sorted by ds
+            Returns:
+                series (CgmSeries): the compact series
+
+        """
+        ts = df['ds'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        return cls(ts, df['y'].to_numpy())
+
+    def take(self, index):
+        """
+            Selects readings by slice (zero-copy views) or by integer/boolean index array
+            Args:
+                index (slice or np.ndarray): readings to keep, in time order
+            Returns:
+                series (CgmSeries): the selected readings
+
+        """
+        series = object.__new__(CgmSeries)
+        for name in self.__slots__:
+            setattr(series, name, getattr(self, name)[index])
+        return series
+
+    def window(self, start, end):
+        """
+            Selects the readings with start < ts <= end by binary search, as a zero-copy slice
+            Args:
+                start (integer): epoch seconds, exclusive (None for the first reading)
+                end (integer): epoch seconds, inclusive (None for the last reading)
+            Returns:
+                series (CgmSeries): the readings of the window
+
+        """
+        lo = 0 if start is None else np.searchsorted(self.ts, start, side='right')
+        hi = len(self.ts) if end is None else np.searchsorted(self.ts, end, side='right')
+        return self.take(slice(lo, hi))
+
+    def select(self, weekdays=None, time_ranges=None):
+        """
+            Finds the readings on the given weekdays and inside any of the given times of day,
+            looking only at the readings of this (already windowed) series
+            Args:
+                weekdays (iterable): weekday numbers, Monday=0 (None for every day)
+                time_ranges (list): (start, end) pairs of datetime.time, inclusive and wrapping
+                    past midnight when start > end (None for the whole day)
+            Returns:
+                index (slice or np.ndarray): slice(None) without filters, else the compact positions to take
+
+        """
+        if weekdays is None and not time_ranges:
+            return slice(None)
+        mask = np.ones(len(self.ts), dtype=bool)
+        if weekdays is not None:
+            mask &= np.isin(self.weekday, list(weekdays))
+        if time_ranges:
+            seconds = self.ts % 86400
+            in_time = np.zeros(len(self.ts), dtype=bool)
+            for start, end in time_ranges:
+                start = start.hour*3600 + start.minute*60 + start.second
+                end = end.hour*3600 + end.minute*60 + end.second
+                if start <= end:
+                    in_time |= (seconds >= start) & (seconds <= end)
+                else:
+                    in_time |= (seconds >= start) | (seconds <= end)
+            mask &= in_time
+        return np.flatnonzero(mask)
+
+    def fingerprint(self):
+        """
+            Hashes the timestamps and glucose values, identifying a dataset and filter combination
+            so that results derived from the series can be cached across Streamlit reruns
+        """
+        return array_key(self.ts, self.y)
+
+    def __len__(self):
+        return len(self.ts)
+
+    @property
+    def empty(self):
+        return len(self.ts) == 0
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    @property
+    def ds(self):
+        return self.ts.astype('datetime64[s]').astype('datetime64[ns]')
+
+    def day_labels(self, fmt='%d/%m/%Y'):
+        """
+            Formats day ordinals as dates, for display
+            Args:
+                fmt (str): strftime format (default='%d/%m/%Y')
+            Returns:
+                labels (np.ndarray): one label per reading
+
+        """
+        days, inverse = np.unique(self.day, return_inverse=True)
+        labels = pd.to_datetime(days.astype('datetime64[D]')).strftime(fmt).to_numpy()
+        return labels[inverse]
+
+    def weekday_labels(self):
+        return np.array(WEEKDAYS)[self.weekday]
+
+    def to_frame(self):
+        return pd.DataFrame({'ds': self.ds, 'y': self.y})
@@ -0,0 +1,57 @@
+import numpy as np
+from scipy.signal import savgol_filter
+from cache import array_key, chart_cache
+
+
+def binned(x, y, points=500):
+    """
+        Averages y over a regular grid of x, filling empty bins by linear interpolation
+        Args:
+            x (np.ndarray): sorted positions (e.g. epoch seconds or minutes of the day)
+            y (np.ndarray): values aligned with x
+            points (integer): number of grid bins (default=500, fewer when there are fewer readings)
+        Returns:
+            grid (np.ndarray): center of each bin
+            mean (np.ndarray): mean of y in each bin
+
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    points = max(min(points, len(x)), 1)
+    lo, hi = x[0], x[-1]
+    width = (hi - lo) / points or 1.0
+    bins = np.minimum(((x - lo) / width).astype(np.int64), points - 1)
+    n = np.bincount(bins, minlength=points)
+    grid = lo + (np.arange(points) + 0.5) * width
+    present = n > 0
+    mean = np.bincount(bins, weights=y, minlength=points)[present] / n[present]
+    return grid, np.interp(grid, grid[present], mean)
+
+
+def smooth(x, y, frac=0.1, points=500):
+    """
+        Fast replacement of the LOWESS trendline: y is averaged on a regular grid in O(n) and
+        the grid is smoothed by a local linear Savitzky-Golay fit over `frac` of its span.
+        Results are memoized in chart_cache by a hash of the data, so redraws are free
+        Args:
+            x (np.ndarray): sorted positions (e.g. epoch seconds or minutes of the day)
+            y (np.ndarray): values aligned with x, without NaN
+            frac (float): share of the x range each local fit spans, as LOWESS frac (default=0.1)
+            points (integer): number of grid points (default=500)
+        Returns:
+            grid (np.ndarray): x of the trend points
+            trend (np.ndarray): smoothed y at each grid point
+
+    """
+    if len(x) == 0:
+        return np.empty(0), np.empty(0)
+    key = ('smooth', array_key(x, y), frac, points)
+    result = chart_cache.get(key)
+    if result is None:
+        grid, mean = binned(x, y, points)
+        window = int(frac * len(grid)) | 1
+        if window >= 3:
+            mean = savgol_filter(mean, window, 1, mode='interp')
+        result = (grid, mean)
+        chart_cache.put(key, result)
+    return result
@@ -0,0 +1,154 @@
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from series import CgmSeries
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# the store has no accounts: anyone reaching the app can read and extend any name, so it is only
+# offered when GLUCODASH_STORE names its directory, for single-user or local deployments
+STORE_ROOT = os.environ.get('GLUCODASH_STORE')
+
+# merges into the same store are serialized: by a lock per store within the process (Streamlit
+# sessions are threads) and by an advisory file lock across processes where fcntl exists
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class ReadingStore:
+    """
+        Local Parquet dataset of one user's readings, one file per calendar month holding sorted,
+        unique int64 timestamps and float32 glucose. Uploads are merged into it, so overlapping
+        re-exports only rewrite the months they touch, and sessions read only the months they need
+    """
+
+    def __init__(self, user, root=None):
+        if not re.fullmatch(r'[\w.-]+', user) or user.strip('.') == '':
+            raise ValueError(f'Invalid store name: {user!r}')
+        root = STORE_ROOT if root is None else root
+        if root is None:
+            raise RuntimeError('The store is disabled, set GLUCODASH_STORE to its directory to enable it')
+        self.user = user
+        self.path = Path(root) / user
+
+    def partitions(self):
+        """
+            Returns the (month, path) pairs of the stored months in time order, months as 'YYYY-MM'
+        """
+        if not self.path.is_dir():
+            return []
+        return sorted((path.stem, path) for path in self.path.glob('*.parquet'))
+
+    def version(self):
+        """
+            Identifies the stored content by the name, size and modification time of every month,
+            so that anything cached from the store is rebuilt after a merge
+        """
+        return tuple((month, path.stat().st_size, path.stat().st_mtime_ns) for month, path in self.partitions())
+
+    @property
+    def empty(self):
+        return not self.partitions()
+
+    def merge(self, series):
+        """
+            Merges readings into the store: the months they fall in are read, combined with them,
+            sorted and deduplicated by timestamp (the new reading wins) and written back atomically
+            Args:
+                series (CgmSeries): readings to add, in time order
+            Returns:
+                added (int): number of readings whose timestamp was not stored yet
+
+        """
+        if series.empty:
+            return 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self.lock():
+            return self._merge(series)
+
+    def _merge(self, series):
+        month = series.ts.astype('datetime64[s]').astype('datetime64[M]')
+        bounds = np.flatnonzero(np.r_[True, month[1:] != month[:-1], True])
+        added = 0
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            path = self.path / f'{month[lo]}.parquet'
+            old_ts, old_y = self._read(path) if path.exists() else (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+            # np.unique keeps the first occurrence, so the new readings go first
+            ts, first = np.unique(np.r_[series.ts[lo:hi], old_ts], return_index=True)
+            y = np.r_[series.y[lo:hi], old_y][first]
+            if np.array_equal(ts, old_ts) and np.array_equal(y, old_y):
+                # an upload seen before leaves the month, and the store version, untouched
+                continue
+            added += len(ts) - len(old_ts)
+            self._write(path, ts, y)
+        return added
+
+    def load(self, start=None, end=None):
+        """
+            Reads the readings with start < ts <= end, opening only the months of that window
+            Args:
+                start (integer): epoch seconds, exclusive (None for the first reading)
+                end (integer): epoch seconds, inclusive (None for the last reading)
+            Returns:
+                series (CgmSeries): the stored readings of the window
+
+        """
+        first = None if start is None else str(np.datetime64(int(start) + 1, 's').astype('datetime64[M]'))
+        last = None if end is None else str(np.datetime64(int(end), 's').astype('datetime64[M]'))
+        parts = [self._read(path) for month, path in self.partitions()
+                 if (first is None or month >= first) and (last is None or month <= last)]
+        ts = np.concatenate([part[0] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+        y = np.concatenate([part[1] for part in parts]) if parts else np.empty(0, dtype=np.float32)
+        return CgmSeries(ts, y).window(start, end)
+
+    def last_ts(self):
+        """
+            Returns the epoch seconds of the latest stored reading (None for an empty store), reading only the last month
+        """
+        partitions = self.partitions()
+        if not partitions:
+            return None
+        return int(self._read(partitions[-1][1])[0][-1])
+
+    @contextmanager
+    def lock(self):
+        """
+            Holds the store for a read-modify-write, against other sessions and processes
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with _locks_guard:
+            lock = _locks.setdefault(str(self.path), threading.Lock())
+        with lock, open(self.path / '.lock', 'w') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _read(path):
+        import pyarrow.parquet as pq
+        # one open handle for the footer and the data, so a month replaced meanwhile is never mixed in
+        with open(path, 'rb') as f:
+            table = pq.ParquetFile(f).read(columns=['ts', 'y'])
+        return table.column('ts').to_numpy().astype(np.int64), table.column('y').to_numpy().astype(np.float32)
+
+    @staticmethod
+    def _write(path, ts, y):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({'ts': pa.array(ts, pa.int64()), 'y': pa.array(y, pa.float32())})
+        # written to a file of its own next to the month and renamed over it, so readers never see
+        # a partial file and concurrent writers (e.g. an upload and a sync) never share one
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as tmp:
+            pq.write_table(table, tmp)
+        try:
+            os.replace(tmp.name, path)
+        except OSError:
+            os.unlink(tmp.name)
+            raise
@@ -0,0 +1,274 @@
+import numpy as np
+from mage import mage
+from risk import risk_space
+from daily import day_starts
+from resample import sampling_interval
+from series import CgmSeries
+from report import MetricsReport, quantile, gmi, ea1c, j_index
+
+
+class StreamingMetrics:
+    """
+        Running state of the CgmMetric panel over a sliding window of readings. Readings are pushed
+        as they arrive and evicted from the start of the window, and every additive metric is updated
+        from the readings that enter or leave: Welford mean and variance, range counters and risk
+        sums, per-day aggregates for the intraday SD and ADRR, and the observed grid slots with the
+        sums of their lagged differences for MODD and CONGA. Each reading costs O(1) amortized.
+        The interquartile range and MAGE are not kept incrementally: report() recomputes them from
+        the readings of the window, sorting it and walking its excursions, which costs O(n log n)
+        per report rather than O(1) per reading
+    """
+
+    def __init__(self, interval=None, hours=24):
+        # grid interval in seconds, inferred from the first push when None (as sampling_interval does)
+        self.interval = interval
+        self.hours = hours
+        self._ts = np.empty(1024, dtype=np.int64)
+        self._y = np.empty(1024, dtype=np.float32)
+        self._head = self._tail = 0
+        self._last = None
+        # Welford state and additive counters
+        self.n, self._mean, self._m2 = 0, 0.0, 0.0
+        self.n_hypo = self.n_range = self.n_hyper = 0
+        self.sum_rl = self.sum_rh = 0.0
+        # day ordinal -> (n, total, sum_sq, max_rl, max_rh), with the sums of the daily sd and risk range
+        self._days = {}
+        self._sd_total = self._risk_range_total = 0.0
+        # grid slot -> (count, total), with the count, sum of absolute values, sum and sum of squares of the lagged differences
+        self._slots = {}
+        self._pairs = np.zeros(4)
+
+    @property
+    def lag(self):
+        return int(round(self.hours*3600 / self.interval))
+
+    def series(self):
+        """
+            Returns the readings of the window as a CgmSeries
+        """
+        return CgmSeries(self._ts[self._head:self._tail], self._y[self._head:self._tail])
+
+    def push(self, readings):
+        """
+            Adds new readings to the end of the window. Readings not newer than the last one pushed
+            are ignored, so overlapping batches (e.g. repeated syncs) can be pushed as they come
+            Args:
+                readings (CgmSeries): readings in time order
+            Returns:
+                added (int): number of readings added
+
+        """
+        ts, y = readings.ts, readings.y
+        keep = np.r_[True, ts[1:] > ts[:-1]] if len(ts) else np.empty(0, dtype=bool)
+        if self._last is not None:
+            keep &= ts > self._last
+        ts, y = ts[keep], y[keep]
+        if len(ts) == 0:
+            return 0
+        if self.interval is None:
+            self.interval = sampling_interval(ts)
+        self._last = int(ts[-1])
+        self._update_totals(y, 1)
+
+        # per-day aggregates, the first day of the batch possibly continuing the last day of the window
+        y64 = y.astype(float)
+        rl, rh = risk_space(y64)
+        day = ts // 86400
+        starts = day_starts(day)
+        n = np.diff(np.r_[starts, len(ts)])
+        total = np.add.reduceat(y64, starts)
+        sum_sq = np.add.reduceat(y64*y64, starts)
+        max_rl = np.maximum.reduceat(rl, starts)
+        max_rh = np.maximum.reduceat(rh, starts)
+        for i, d in enumerate(day[starts].tolist()):
+            old = self._days.get(d)
+            if old is None:
+                self._set_day(d, (n[i], total[i], sum_sq[i], max_rl[i], max_rh[i]))
+            else:
+                self._set_day(d, (old[0] + n[i], old[1] + total[i], old[2] + sum_sq[i], max(old[3], max_rl[i]), max(old[4], max_rh[i])))
+
+        slot = np.rint(ts / self.interval).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, slot[1:] != slot[:-1]])
+        count = np.diff(np.r_[starts, len(ts)])
+        total = np.add.reduceat(y64, starts)
+        for s, c, t in zip(slot[starts].tolist(), count.tolist(), total.tolist()):
+            old = self._slots.get(s, (0, 0.0))
+            self._set_slot(s, (old[0] + c, old[1] + t))
+
+        self._append(ts, y)
+        return len(ts)
+
+    def evict_before(self, ts):
+        """
+            Removes the readings older than ts from the start of the window. A day or grid slot
+            that is only partly evicted is recomputed from the readings it keeps
+            Args:
+                ts (integer): epoch seconds of the new start of the window, inclusive
+            Returns:
+                evicted (int): number of readings removed
+
+        """
+        lo = self._head
+        hi = lo + int(np.searchsorted(self._ts[lo:self._tail], ts, side='left'))
+        if hi == lo:
+            return 0
+        y = self._y[lo:hi]
+        self._update_totals(y, -1)
+        self._head = hi
+        kept_ts, kept_y = self._ts[hi:self._tail], self._y[hi:self._tail].astype(float)
+
+        first_day = kept_ts[0] // 86400 if len(kept_ts) else None
+        for d in np.unique(self._ts[lo:hi] // 86400).tolist():
+            if d != first_day:
+                self._set_day(d, None)
+                continue
+            # the first kept day lost its earlier readings: rebuild it from those left
+            same = int(np.searchsorted(kept_ts, (d + 1)*86400, side='left'))
+            rl, rh = risk_space(kept_y[:same])
+            self._set_day(d, (same, kept_y[:same].sum(), (kept_y[:same]**2).sum(), rl.max(), rh.max()))
+        # days leave the window about once per day of readings, so the sums are rebuilt rather than subtracted from
+        self._resum_days()
+
+        slot = np.rint(self._ts[lo:hi] / self.interval).astype(np.int64)
+        first_slot = int(np.rint(kept_ts[0] / self.interval)) if len(kept_ts) else None
+        for s in np.unique(slot).tolist():
+            if s != first_slot:
+                self._set_slot(s, None)
+                continue
+            same = int(np.count_nonzero(np.rint(kept_ts[:self._slots[s][0]] / self.interval) == s))
+            self._set_slot(s, (same, kept_y[:same].sum()))
+
+        if self._head > len(self._ts) // 2:
+            self._compact()
+        return hi - lo
+
+    def report(self):
+        """
+            Returns the CgmMetric.compute_all panel of the window, rounded the same way. The running
+            state answers every field but inter_qr and MAGE, which are recomputed from the window here
+            Returns:
+                report (MetricsReport): the metrics of the readings currently in the window
+
+        """
+        n = self.n
+        mean = self._mean if n else np.nan
+        std = np.sqrt(self._m2 / n) if n else np.nan
+        n_days = len(self._days)
+        n_pairs, sum_abs, sum_diff, sum_sq = self._pairs
+        conga = np.sqrt(max(sum_sq - sum_diff**2 / n_pairs, 0) / (n_pairs - 1)) if n_pairs >= 2 else np.nan
+        y = self._y[self._head:self._tail]
+        sorted_y = np.sort(y.astype(float))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return MetricsReport(
+                available_data=int(n),
+                average_glucose=round(mean) if n else np.nan,
+                sd=round(np.sqrt(self._m2 / (n - 1)), 2) if n > 1 else np.nan,
+                eA1c=ea1c(mean),
+                time_in_range=round(np.float64(self.n_range) / n * 100, 2),
+                hyper_time=round(np.float64(self.n_hyper) / n * 100, 2),
+                hypo_time=round(np.float64(self.n_hypo) / n * 100, 2),
+                inter_qr=quantile(sorted_y, 0.75) - quantile(sorted_y, 0.25) if n else np.nan,
+                interdaysd=std,
+                intradaysd=self._sd_total / n_days if n_days else np.nan,
+                MAGE=mage(y) if n else np.nan,
+                J_index=j_index(mean, std),
+                LBGI=self.sum_rl / n if n else np.nan,
+                HBGI=self.sum_rh / n if n else np.nan,
+                ADRR=self._risk_range_total / n_days if n_days else np.nan,
+                MODD=sum_abs / n_pairs if n_pairs else np.nan,
+                CONGA24=conga,
+                GMI=gmi(mean),
+            )
+
+    def _update_totals(self, y, sign):
+        # Welford/Chan update with a whole batch: merged when sign is 1, removed when it is -1
+        y = y.astype(float)
+        nb, mb = len(y), y.mean()
+        m2b = ((y - mb)**2).sum()
+        n = self.n + sign*nb
+        if n == 0:
+            self._mean, self._m2 = 0.0, 0.0
+        elif sign > 0:
+            delta = mb - self._mean
+            self._mean += delta*nb / n
+            self._m2 += m2b + delta**2*self.n*nb / n
+        else:
+            mean = (self.n*self._mean - nb*mb) / n
+            delta = mb - mean
+            self._m2 = max(self._m2 - m2b - delta**2*n*nb / self.n, 0.0)
+            self._mean = mean
+        self.n = n
+        self.n_hypo += sign*int(np.count_nonzero(y < 70))
+        self.n_range += sign*int(np.count_nonzero((y >= 70) & (y <= 180)))
+        self.n_hyper += sign*int(np.count_nonzero(y > 180))
+        rl, rh = risk_space(y)
+        self.sum_rl += sign*rl.sum()
+        self.sum_rh += sign*rh.sum()
+
+    def _set_day(self, day, value):
+        # replaces the aggregates of a day (None removes it), keeping the sums over days in step
+        for sign, aggregates in ((-1, self._days.get(day)), (1, value)):
+            if aggregates is None:
+                continue
+            sd, risk_range = day_terms(aggregates)
+            self._sd_total += sign*sd
+            self._risk_range_total += sign*risk_range
+        if value is None:
+            self._days.pop(day, None)
+        else:
+            self._days[day] = value
+
+    def _resum_days(self):
+        # rebuilds the sums over days from the per-day aggregates, clearing the rounding left by the updates
+        terms = [day_terms(aggregates) for aggregates in self._days.values()]
+        self._sd_total = float(sum(sd for sd, _ in terms))
+        self._risk_range_total = float(sum(risk_range for _, risk_range in terms))
+
+    def _set_slot(self, slot, value):
+        # replaces the mean of a grid slot (None removes it), with its differences to the slots one lag away
+        lag = self.lag
+        for sign, slot_value in ((-1, self._slots.get(slot)), (1, value)):
+            if slot_value is None:
+                continue
+            v = slot_value[1] / slot_value[0]
+            for partner, direction in ((slot - lag, 1), (slot + lag, -1)):
+                other = self._slots.get(partner)
+                if other is not None and partner != slot:
+                    diff = direction*(v - other[1] / other[0])
+                    self._pairs += sign*np.array([1, abs(diff), diff, diff*diff])
+        if value is None:
+            self._slots.pop(slot, None)
+        else:
+            self._slots[slot] = value
+
+    def _append(self, ts, y):
+        if self._tail + len(ts) > len(self._ts):
+            self._compact(len(ts))
+        self._ts[self._tail:self._tail + len(ts)] = ts
+        self._y[self._tail:self._tail + len(ts)] = y
+        self._tail += len(ts)
+
+    def _compact(self, extra=0):
+        # moves the window to the start of the buffers, doubling them when it would not fit
+        size = self._tail - self._head
+        capacity = len(self._ts)
+        while size + extra > capacity:
+            capacity *= 2
+        ts, y = np.empty(capacity, dtype=np.int64), np.empty(capacity, dtype=np.float32)
+        ts[:size], y[:size] = self._ts[self._head:self._tail], self._y[self._head:self._tail]
+        self._ts, self._y, self._head, self._tail = ts, y, 0, size
+
+
+def day_terms(aggregates):
+    """
+        Computes the contribution of one day to the intraday SD and ADRR, as daily_table does
+        Args:
+            aggregates (tuple): n, total, sum_sq, max_rl and max_rh of the day
+        Returns:
+            sd (float): population standard deviation of the day
+            risk_range (float): max_rl + max_rh
+
+    """
+    n, total, sum_sq, max_rl, max_rh = aggregates
+    mean = total / n
+    return np.sqrt(max(sum_sq / n - mean**2, 0)), max_rl + max_rh
@@ -0,0 +1,37 @@
+import pandas as pd
+from ingest import read_device_csv, read_device_csv_chunked, sniff
+
+
+def libre_export(timestamps, fmt):
+    head = ('Glucose Data,Generated on,01-31-2022 10:00 AM,Generated by,test\n'
+            'Device,Serial Number,Device Timestamp,Record Type,Historic Glucose mg/dL,Scan Glucose mg/dL\n')
+    rows = ''.join(f'FreeStyle LibreLink,abc,{t.strftime(fmt)},0,{100 + i % 50},\n' for i, t in enumerate(timestamps))
+    return (head + rows).encode()
+
+
+def test_chunked_reader_drops_an_ambiguous_sniffed_format():
+    # month-first 24 h dates whose first lines also read as day-first
+    timestamps = pd.date_range('2022-01-01', periods=8640, freq='5min')
+    raw = libre_export(timestamps, '%m-%d-%Y %H:%M')
+    sniffed = sniff(raw)
+    assert sniffed.timestamp_format == '%d-%m-%Y %H:%M'
+    for chunksize in (500_000, 1000):
+        df = read_device_csv_chunked(raw, sniffed.device, chunksize=chunksize, timestamp_format=sniffed.timestamp_format)
+        assert len(df) == len(timestamps)
+        assert (df['ds'].to_numpy() == timestamps.to_numpy()).all()
+
+
+def test_mixed_offsets_are_read_on_the_wall_clock():
+    # a Nightscout export across the end of daylight saving time, UTC+2 then UTC+1
+    raw = ('Nightscout export\n'
+           '_id;device;date;dateString;direction;type;sgv;utcOffset\n'
+           'a;xDrip;1666828200000;2022-10-27T01:50:00.000+02:00;Flat;sgv;120;120\n'
+           'b;xDrip;1666830000000;2022-10-27T02:20:00.000+02:00;Flat;sgv;125;120\n'
+           'c;xDrip;1667093400000;2022-10-30T02:30:00.000+01:00;Flat;sgv;130;60\n'
+           'd;xDrip;1667095200000;2022-10-30T03:00:00.000+01:00;Flat;sgv;135;60\n').encode()
+    expected = pd.to_datetime(['2022-10-27 01:50', '2022-10-27 02:20', '2022-10-30 02:30', '2022-10-30 03:00'])
+    for engine in ('pyarrow', 'c'):
+        df = read_device_csv(raw, 'Nightscout', engine=engine)
+        assert (df['ds'].to_numpy() == expected.to_numpy()).all()
+    df = read_device_csv_chunked(raw, 'Nightscout', chunksize=2)
+    assert (df['ds'].to_numpy() == expected.to_numpy()).all()
@@ -0,0 +1,75 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from nightscout import NightscoutClient
+from store import ReadingStore
+
+START = 1_650_000_000_000
+
+
+class Site(BaseHTTPRequestHandler):
+    # answers /api/v1/entries.json from `entries` like Nightscout: filtered by date, newest first, `count` at most
+    entries = []
+    queries = []
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.queries.append(query)
+        page = [entry for entry in self.entries
+                if entry['date'] > int(query.get('find[date][$gt]', -1))
+                and entry['date'] <= int(query.get('find[date][$lte]', 2**62))]
+        page = sorted(page, key=lambda entry: -entry['date'])[:int(query['count'])]
+        body = json.dumps(page).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def site():
+    # three uploaders send every reading, so each date is shared by three entries
+    Site.entries = [{'_id': f'{i}-{j}', 'type': 'sgv', 'date': START + i*300_000, 'sgv': 100 + i % 50, 'utcOffset': 0}
+                    for i in range(100) for j in range(3)]
+    Site.queries = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Site)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_paging_keeps_the_entries_sharing_a_page_boundary(site, tmp_path):
+    # 7 per page splits the entries of a date across pages
+    client = NightscoutClient(site, ReadingStore('test', tmp_path), page_size=7)
+    entries = [entry for page in client.entries() for entry in page]
+    assert sorted(entry['_id'] for entry in entries) == sorted(entry['_id'] for entry in Site.entries)
+    assert all('find[date][$lte]' in query for query in Site.queries[1:])
+
+
+def test_sync_fetches_late_entries_within_the_overlap(site, tmp_path):
+    store = ReadingStore('test', tmp_path)
+    client = NightscoutClient(site, store, page_size=20, overlap=3)
+    assert client.sync() == 100
+    last = START + 99*300_000
+    assert client.cursor() == last
+
+    # nothing new: the overlap is fetched again but adds nothing, and the cursor stays
+    assert client.sync() == 0
+    assert client.cursor() == last
+
+    # uploaded late, with dates before the cursor: inside the overlap it is stored, outside it is not
+    Site.entries.append({'_id': 'late', 'type': 'sgv', 'date': last - 3600_000 + 60_000, 'sgv': 222, 'utcOffset': 0})
+    Site.entries.append({'_id': 'older', 'type': 'sgv', 'date': last - 4*3600_000 + 60_000, 'sgv': 222, 'utcOffset': 0})
+    assert client.sync() == 1
+    assert client.cursor() == last
+    assert len(store.load()) == 101
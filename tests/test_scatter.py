@@ -0,0 +1,48 @@
+import numpy as np
+from series import CgmSeries
+from util import CgmMetric
+
+
+def history(days, interval, gaps=()):
+    ts = 1_640_995_200 + np.arange(days*86400 // interval)*interval
+    keep = np.ones(len(ts), dtype=bool)
+    for start, hours in gaps:
+        keep &= ~((ts >= ts[0] + start*86400) & (ts < ts[0] + start*86400 + hours*3600))
+    ts = ts[keep]
+    y = 140 + 60*np.sin(ts / 20000)
+    return CgmSeries(ts, y)
+
+
+def segments(y):
+    # runs of consecutive drawable points between NaN breaks
+    breaks = np.flatnonzero(np.isnan(y))
+    return np.split(y, breaks)
+
+
+def test_scatter_breaks_only_at_sensor_gaps():
+    for interval in (300, 900):
+        series = history(120, interval, gaps=[(10, 5), (40, 2), (80, 12)])
+        ts, y = CgmMetric(series).scatter_points(budget=2000)
+        assert np.isnan(y).sum() == 3
+        drawable = [segment for segment in segments(y) if np.count_nonzero(~np.isnan(segment)) >= 2]
+        assert len(drawable) == 4
+        assert np.count_nonzero(~np.isnan(y)) >= 2000
+
+
+def test_scatter_keeps_the_readings_around_a_gap():
+    series = history(365, 300, gaps=[(200, 3)])
+    ts, y = CgmMetric(series).scatter_points(budget=2000)
+    gap = np.flatnonzero(np.isnan(y))[0]
+    assert ts[gap + 1] - ts[gap - 1] > 3*3600 - 300
+    assert ts[gap + 1] - ts[gap - 1] <= 3*3600 + 300
+
+
+def test_scatter_breaks_at_most_half_the_budget_of_gaps():
+    # a 2 h gap every 6 h and a day-long one: far more gaps than the chart can show
+    gaps = [(day + quarter / 4, 2) for day in range(120) for quarter in range(4) if day != 60] + [(60, 24)]
+    series = history(120, 300, gaps=gaps)
+    ts, y = CgmMetric(series).scatter_points(budget=200)
+    assert np.isnan(y).sum() == 100
+    assert len(y) <= 4.5*200
+    breaks = np.flatnonzero(np.isnan(y))
+    assert (ts[breaks + 1] - ts[breaks - 1] > 24*3600).any()
@@ -1,185 +1,451 @@
 # from pycaret.anomaly import *
 import pandas as pd
 pd.options.mode.chained_assignment = None
-import datetime
 import streamlit as st
 import numpy as np
-from scipy.stats import iqr
-import plotly.express as px
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from mage import mage
+from lag import lagged_differences, modd, conga
+from resample import resample
+from risk import risk_space, lbgi, hbgi
+from report import MetricsReport, sufficient_stats, gmi, ea1c, j_index
+from cache import content_key, parse_cache, chart_cache
+from cube import StatsCube
+from rolling import rolling_metrics
+from periods import compare_periods
+from daily import daily_table
+from agp import agp
+from smoothing import smooth
+from downsample import downsample
+from ranges import RANGE_TIERS, weekday_ranges
+from episodes import episode_table, episode_summary
+from ingest import CHUNKED_BYTES, PARSE_ERRORS, read_device_csv, read_device_csv_chunked, sniff
+from series import CgmSeries, WEEKDAYS
+try:
+    from streamlit.runtime.scriptrunner import StopException, get_script_run_ctx
+except ImportError:
+    # streamlit < 1.12, as pinned in requirements.txt
+    from streamlit.scriptrunner import StopException, get_script_run_ctx
+from store import ReadingStore
+
+def in_streamlit_run():
+    """
+        Tells whether the code runs inside a Streamlit script run, without the bare-mode warning
+    """
+    try:
+        return get_script_run_ctx(suppress_warning=True) is not None
+    except TypeError:
+        # streamlit < 1.12 takes no argument and does not warn
+        return get_script_run_ctx() is not None
+
+
+class DataError(ValueError):
+    """
+        Raised by FinalData.fail when the script is not run by Streamlit (e.g. batch.py), instead of stopping the run
+    """
+
 
 class FinalData:
 
-    def __init__(self, data, device: str, time_range: str, week_day: str, start_time: str, end_time):
+    ranges = {'2 weeks': 14, '1 month': 30, '3 months': 90, '6 months': 180, '1 year': 365}
+
+    def __init__(self, data, device: str, time_range: str, week_day: str, start_time: str, end_time, time_ranges=None, history=2):
         self.data = data
         self.device = device
         self.time_range = time_range
         self.week_day = week_day
         self.start_time = start_time
         self.end_time = end_time
+        self.time_ranges = time_ranges
+        # periods of time_range read from a ReadingStore: the current one and those compared with it
+        self.history = history
+        self._key = None
+
+    def fail(self, message):
+        """
+            Shows an error and stops the Streamlit run; outside of a run (e.g. batch.py) only raises DataError
+        """
+        if not in_streamlit_run():
+            raise DataError(message)
+        st.error(message)
+        st.stop()
+
+    def raw_data(self):
+        """
+            Returns the content of the uploaded file
+            Args:
+                data (UploadedFile, file-like or path): the uploaded glucose data
+            Returns:
+                raw (bytes): content of the file
+                
+        """
+        if hasattr(self.data, 'getvalue'):
+            return self.data.getvalue()
+        if hasattr(self.data, 'read'):
+            self.data.seek(0)
+            return self.data.read()
+        with open(self.data, 'rb') as f:
+            return f.read()
 
     def preprocessing(self):
+        """
+            Returns the parsed upload as a dataframe
+            Args:
+                data (UploadedFile, file-like or path): the uploaded glucose data
+                device (str): device the data was exported from
+            Returns:
+                df (pd.DataFrame): sorted data with y and ds columns
+                
+        """
+        return self.index().to_frame()
 
-        device_dict = {'Freestyle Libre': [4, 2], 'Dexcom': [7, 1], 'Nightscout': [-2, 3]}
-        if self.device != 'Nightscout':
-            try:
-                df = pd.read_csv(self.data, delimiter=',', skiprows=1)
-                df['y'] = df.iloc[:, device_dict[self.device][0]]
-                df['ds'] = df.iloc[:, device_dict[self.device][1]]
-            except:
-                st.error('Your data does not match with the specified device. Please check above.')
-                st.stop()
-        else:
+    def index(self):
+        """
+            Parses the upload and builds its time-sorted CgmSeries once per content and device,
+            keeping it in parse_cache so that filter changes on Streamlit reruns only slice it
+            Args:
+                data (UploadedFile, file-like or path): the uploaded glucose data
+                device (str): device the data was exported from
+            Returns:
+                series (CgmSeries): every reading of the upload
+                
+        """
+        if isinstance(self.data, ReadingStore):
+            return self.stored()
+        raw = self.raw_data()
+        if self._key is None:
+            self._key = content_key(raw, self.device)
+        series = parse_cache.get(self._key)
+        if series is None:
             try:
-                df = pd.read_csv(self.data, low_memory=False, delimiter=';', skiprows=1)
-                df['y'] = df.iloc[:, device_dict[self.device][0]]
-                df['ds'] = df.iloc[:, device_dict[self.device][1]]
-            except:
-                st.error('Your data does not match with the specified device. Please check above.')
-                st.stop()
-        if df['y'].mean() < 40:
-            df['y'] = df['y'].apply(lambda x: x*18)
-        rest = df.drop(['y', 'ds'], axis=1)
-        df.drop(rest, inplace=True, axis=1)
-        df['ds'].drop_duplicates(inplace=True)
+                series = CgmSeries.from_frame(self.parse(raw))
+            except DataError:
+                raise
+            except PARSE_ERRORS:
+                self.fail('Your data is corruptded. Please check it for errors and be sure to upload the data immediatly after exported from the CGM website. If error continues, please contact us.')
+            parse_cache.put(self._key, series)
+        return series
+
+    def stored(self):
+        """
+            Reads the readings of the current period and the history - 1 periods before it from a
+            ReadingStore, opening only their months, once per store version
+            Args:
+                data (ReadingStore): the user's stored readings
+                time_range (str): length of the periods ('All times' reads everything)
+            Returns:
+                series (CgmSeries): the stored readings of the periods
+
+        """
+        store = self.data
+        last = store.last_ts()
+        if last is None:
+            self.fail('There is no stored data under this name yet. Please upload a file first.')
+        start = None
+        if self.time_range != 'All times':
+            start = last - self.history*self.ranges.get(self.time_range, self.time_range)*86400
+        if self._key is None:
+            self._key = ('store', str(store.path), store.version(), start)
+        series = parse_cache.get(self._key)
+        if series is None:
+            series = store.load(start)
+            parse_cache.put(self._key, series)
+        return series
+
+    def cube(self):
+        """
+            Builds the StatsCube of the upload once per content and device, next to its series in parse_cache
+            Args:
+                data (UploadedFile, file-like or path): the uploaded glucose data
+                device (str): device the data was exported from
+            Returns:
+                cube (StatsCube): additive statistics per calendar day and 5-minute bin
+                
+        """
+        series = self.index()
+        key = self._key + ('cube',)
+        cube = parse_cache.get(key)
+        if cube is None:
+            cube = StatsCube(series)
+            parse_cache.put(key, cube)
+        return cube
+
+    def parse(self, raw):
+        """
+            Sniffs the first bytes of the upload for its layout, timestamp format and unit, then
+            reads the glucose and timestamp columns once with those settings
+            Args:
+                raw (bytes): content of the uploaded file
+            Returns:
+                df (pd.DataFrame): sorted data with y (mg/dL) and ds columns
+                
+        """
+        device = None if self.device == 'Auto-detect' else self.device
         try:
-            df['ds'] = pd.to_datetime(df['ds'])
-        except:
-            st.error('Your data does not match with the specified device. Please check above.')
-            st.stop()
-        df.sort_values(by=['ds'], inplace=True)
+            sniffed = sniff(raw, device)
+            if len(raw) > CHUNKED_BYTES:
+                df = read_device_csv_chunked(raw, sniffed.device, timestamp_format=sniffed.timestamp_format)
+            else:
+                df = read_device_csv(raw, sniffed.device, timestamp_format=sniffed.timestamp_format)
+        except ValueError:
+            if device is None:
+                self.fail('We could not recognize the device of your data. Please select it above.')
+            else:
+                self.fail('Your data does not match with the specified device. Please check above.')
+        if sniffed.unit == 'mmol/L' or (sniffed.unit is None and df['y'].mean() < 40):
+            df['y'] *= 18
+        df.sort_values(by=['ds'], inplace=True, kind='stable')
         df.dropna(inplace=True)
+        df.drop_duplicates(subset=['ds'], inplace=True)
         df.reset_index(inplace=True, drop=True)
 
         return df
 
+    def weekdays(self):
+        """
+            Returns the weekday numbers selected by week_day, which may be 'Every Day', a day name or a list of day names
+        """
+        if self.week_day == 'Every Day':
+            return None
+        if isinstance(self.week_day, str):
+            return {WEEKDAYS.index(self.week_day)}
+        return {WEEKDAYS.index(day) for day in self.week_day}
+
+    def times_of_day(self):
+        """
+            Returns the (start, end) times of day to keep, from start_time/end_time and time_ranges
+        """
+        time_ranges = list(self.time_ranges or [])
+        if self.end_time is not None:
+            time_ranges.append((self.start_time, self.end_time))
+        return time_ranges
+
+    def period(self, start, end):
+        """
+            Selects the readings between two dates that match the weekday and time-of-day filters,
+            in O(log n + k) for a window of k readings
+            Args:
+                start (datetime-like): start of the period, exclusive (None for the first reading)
+                end (datetime-like): end of the period, inclusive (None for the last reading)
+            Returns:
+                series (CgmSeries): the selected readings
+                
+        """
+        start = None if start is None else pd.Timestamp(start).value // 10**9
+        end = None if end is None else pd.Timestamp(end).value // 10**9
+        return self._filtered(self.index().window(start, end))
+
+    def _filtered(self, window):
+        return window.take(window.select(self.weekdays(), self.times_of_day()))
+
+    def grid(self):
+        """
+            Resamples the whole upload onto a fixed grid once per content and device, next to its series in parse_cache
+            Args:
+                data (UploadedFile, file-like or path): the uploaded glucose data
+                device (str): device the data was exported from
+            Returns:
+                grid (Grid): glucose on the sampling interval of the device, with NaN gaps and the observed mask
+                
+        """
+        series = self.index()
+        key = self._key + ('grid',)
+        grid = parse_cache.get(key)
+        if grid is None:
+            grid = resample(series)
+            parse_cache.put(key, grid)
+        return grid
+
+    def sensor_wear(self):
+        """
+            Returns the percentage of the current period during which the sensor recorded readings
+        """
+        return self.grid().wear(*self.windows()[0])
+
+    def windows(self):
+        """
+            Returns the (start, end] epoch seconds of the current and previous periods of time_range,
+            ending at the last reading; the previous period is None for 'All times'
+        """
+        last_date = int(self.index().ts[-1])
+        if self.time_range == 'All times':
+            return (None, last_date), None
+        # time_range is one of the labels of ranges or a custom number of days
+        curr_range = self.ranges.get(self.time_range, self.time_range)*86400
+        starter = last_date-curr_range
+        return (starter, last_date), (starter-curr_range, starter)
+
+    def compare(self, n_previous=1):
+        """
+            Computes the metrics of the current period and of the n_previous periods of the same
+            length before it in one grouped pass, with their additive statistics from the cube
+            Args:
+                time_range, week_day, start_time, end_time, time_ranges: the active filters
+                n_previous (integer): number of earlier periods to compare with (default=1, none for 'All times')
+            Returns:
+                comparison (PeriodComparison): current report, previous reports and deltas, most recent first
+                
+        """
+        cube = self.cube()
+        edges = self.edges(n_previous)
+        stats = [cube.query(edges[i], edges[i + 1], self.weekdays(), self.times_of_day()) for i in range(len(edges) - 1)]
+        return compare_periods(self._filtered(self.index().window(edges[0], edges[-1])), edges, stats)
+
+    def edges(self, n_previous=1):
+        """
+            Returns the ascending epoch seconds limiting the n_previous periods and the current one,
+            period i holding edges[i] < ts <= edges[i + 1] (only the current period for 'All times')
+        """
+        current, previous = self.windows()
+        start, end = current
+        if previous is None:
+            return [int(self.index().ts[0]) - 1, end]
+        return [end - k*(end - start) for k in range(n_previous + 1, -1, -1)]
+
     @property
     def filter_data(self):
 
-        df = self.preprocessing()
-        try:
-            time = df['ds']
-            df['day_of_week'] = time.dt.day_name()
-            df['Day'] = time.dt.day
-            df['Hour'] = time.dt.strftime('%H')
-            df['dd_mm_yy'] = time.dt.strftime('%d/%m/%Y')
-            df['hh_mm'] = time.dt.strftime('%H:%M')
-            df.index = df['ds']
-            last_date = df['ds'][-1]
-        except:
-            st.error('Your data is corruptded. Please check it for errors and be sure to upload the data immediatly after exported from the CGM website. If error continues, please contact us.')
-            st.stop()
-
-        ranges = {'2 weeks': 14, '1 month': 30, '3 months': 90, '6 months': 180, '1 year': 365}
+        series = self.index()
+        if series.empty:
+            self.fail('Your data is corruptded. Please check it for errors and be sure to upload the data immediatly after exported from the CGM website. If error continues, please contact us.')
 
-        if self.time_range != 'All times':
-            curr_range = ranges[self.time_range]
-            starter = last_date-datetime.timedelta(days=curr_range)
-            mask = (df['ds'] > starter) & (df['ds'] <= last_date)
-            starter2 = starter-datetime.timedelta(days=curr_range)
-            mask2 = (df['ds'] > starter2) & (df['ds'] <= starter)
-            # st.dataframe(df[df.index.duplicated()])
-            df1 = df.loc[mask]
-            if mask2 is not None:
-                df2 = df.loc[mask2]
-            else:
-                df2 = None
-        if self.week_day != 'Every Day':
-            df1 = df1.loc[df1['day_of_week'] == self.week_day]
-            if df2 is not None:
-                df2 = df2.loc[df2['day_of_week'] == self.week_day]
-        if self.end_time is not None:
-            df1 = df1.between_time(self.start_time, self.end_time)
-            df2 = df2.between_time(self.start_time, self.end_time)
+        current, previous = self.windows()
+        df1 = self._filtered(series.window(*current))
+        if previous is not None:
+            df2 = self._filtered(series.window(*previous))
+        else:
+            df2 = series.take(slice(0, 0))
+        if df1.empty:
+            self.fail('There is no data for the selected filters. Please change them above.')
 
-        start_date = df1['ds'][0]
-        final_date = df1['ds'][-1]
+        start_date = pd.Timestamp(df1.ts[0], unit='s')
+        final_date = pd.Timestamp(df1.ts[-1], unit='s')
 
         return df1, df2, start_date.strftime('%d/%m/%Y'), final_date.strftime('%d/%m/%Y')
 
 
 class CgmMetric:
 
-    def __init__(self, filtered_df):
+    def __init__(self, series, stats=None):
+
+        if isinstance(series, pd.DataFrame):
+            series = CgmSeries.from_frame(series)
+        self.series = series
+        self._grid = None
+        self._lags = {}
+        self._risk = None
+        self._daily = None
+        self._fingerprint = None
+        # statistics answered by the StatsCube (e.g. FinalData.cube().query), if any
+        self._stats = stats
 
-        self.filtered_df = filtered_df
+    def stats(self):
+        """
+            Computes (once) and returns the sufficient statistics every summary metric is derived from
+            Args:
+                (CgmSeries): compact glucose series
+            Returns:
+                stats (SufficientStats): count, sum, sum of squares, range counts and sorted y
+                
+        """
+        if self._stats is None:
+            self._stats = sufficient_stats(self.series.y)
+        return self._stats
+
+    def sorted_stats(self):
+        """
+            Returns the sufficient statistics with sorted y, sorting the raw values when the
+            statistics came from the cube, which cannot answer quantiles
+        """
+        stats = self.stats()
+        if stats.sorted_y is None:
+            self._stats = stats = stats._replace(sorted_y=np.sort(self.series.y.astype(float)))
+        return stats
 
     def available_data(self):
-        self.available_measurements = len(self.filtered_df)
+        self.available_measurements = self.stats().n
         return int(self.available_measurements)
 
     def average_glucose(self):
-        avg = self.filtered_df['y'].mean()
+        avg = self.stats().mean
         return round(avg)
 
     def time_in_range(self):
-        in_range = (self.filtered_df['y'] >= 70) & (self.filtered_df['y'] <= 180)
-        in_range = self.filtered_df.loc[in_range]
-        n_in_range = len(in_range)
-        tir = (n_in_range / self.available_measurements) * 100
+        stats = self.stats()
+        tir = (stats.n_range / stats.n) * 100
         return round(tir, 2)
 
     def hypo_time(self):
-        in_hypo = (self.filtered_df['y'] < 70)
-        in_hypo = self.filtered_df.loc[in_hypo]
-        n_in_hypo = len(in_hypo)
-        tihypo = (n_in_hypo / self.available_measurements) * 100
+        stats = self.stats()
+        tihypo = (stats.n_hypo / stats.n) * 100
         return round(tihypo, 2)
 
     def hyper_time(self):
-        in_hyper = (self.filtered_df['y'] > 180)
-        in_hyper = self.filtered_df.loc[in_hyper]
-        n_in_hyper = len(in_hyper)
-        tihyper = (n_in_hyper / self.available_measurements) * 100
+        stats = self.stats()
+        tihyper = (stats.n_hyper / stats.n) * 100
         return round(tihyper, 2)
 
     def sd(self):
-        sd = self.filtered_df['y'].std()
+        sd = self.stats().std(ddof=1)
         return round(sd, 2)
 
     def inter_qr(self):
-        inter_qr = iqr(self.filtered_df['y'])
+        stats = self.sorted_stats()
+        inter_qr = stats.quantile(0.75) - stats.quantile(0.25)
         return inter_qr
 
     def interdaycv(self):
         """
             Computes and returns the interday coefficient of variation of y
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 cvx (float): interday coefficient of variation averaged over all days
                 
         """
-        cvx = (np.std(self.filtered_df['y']) / (np.mean(self.filtered_df['y'])))*100
+        stats = self.stats()
+        cvx = (stats.std() / stats.mean)*100
         return cvx
 
     def interdaysd(self):
         """
             Computes and returns the interday standard deviation of y
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 interdaysd (float): interday standard deviation averaged over all days
                 
         """
-        self.interdaysd = np.std(self.filtered_df['y'])
-        return self.interdaysd
+        return self.stats().std()
+
+    def daily(self):
+        """
+            Computes (once) and returns the per-calendar-day metrics table the intraday summaries,
+            ADRR and the best/worst days are derived from
+            Args:
+                (CgmSeries): compact glucose series
+            Returns:
+                df (pd.DataFrame): one row per day, see daily.daily_table
+                
+        """
+        if self._daily is None:
+            self._daily = daily_table(self.series, risk=self.risk_space())
+        return self._daily
 
     def intradaycv(self):
         """
             Computes and returns the intraday coefficient of variation of y 
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 intradaycv_mean (float): intraday coefficient of variation averaged over all days
                 intradaycv_medan (float): intraday coefficient of variation median over all days
                 intradaycv_sd (float): intraday coefficient of variation standard deviation over all days
                 
         """
-        intradaycv = []
-        for i in pd.unique(self.filtered_df['Day']):
-            intradaycv.append(self.interdaycv(self.filtered_df[self.filtered_df['Day']==i]))
-        
+        intradaycv = self.daily()['CV'].to_numpy()
+
         intradaycv_mean = np.mean(intradaycv)
         intradaycv_median = np.median(intradaycv)
         intradaycv_sd = np.std(intradaycv)
@@ -191,24 +457,21 @@ class CgmMetric:
         """
             Computes and returns the intraday standard deviation of y 
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 intradaysd_mean (float): intraday standard deviation averaged over all days
                 intradaysd_medan (float): intraday standard deviation median over all days
                 intradaysd_sd (float): intraday standard deviation standard deviation over all days
                 
         """
-        intradaysd =[]
+        intradaysd = self.daily()['sd'].to_numpy()
 
-        for i in pd.unique(self.filtered_df['day_of_week']):
-            intradaysd.append(np.std(self.filtered_df['y'][self.filtered_df['day_of_week']==i]))
-        
         intradaysd_mean = np.mean(intradaysd)
         intradaysd_median = np.median(intradaysd)
         intradaysd_sd = np.std(intradaysd)
         return intradaysd_mean, intradaysd_median, intradaysd_sd
 
-    def MAGE(self, std=1):
+    def MAGE(self, std=1, algorithm='current'):
         """
             Mean amplitude of glycemic excursions (MAGE), together with mean and SD,
             is the most popular parameter for assessing glycemic variability and is calculated
@@ -218,81 +481,17 @@ class CgmMetric:
 
             Computes and returns the mean amplitude of y excursions
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
                 sd (integer): standard deviation for computing range (default=1)
+                algorithm (str): 'current' keeps the original Glucodash results, 'service' uses the classic Service method
             Returns:
                 MAGE (float): the mean amplitude of y excursions 
             Refs:
                 Sneh Gajiwala: https://github.com/snehG0205/NCSA_genomics/tree/2bfbb87c9c872b1458ef3597d9fb2e56ac13ad64
+                Service et al., Mean amplitude of glycemic excursions, a measure of diabetic instability. Diabetes, 1970
                 
         """
-        
-        #extracting y values and incdices
-        y = self.filtered_df['y'].tolist()
-        # ix = [1*i for i in range(len(y))]
-        stdev = std
-        
-        # local minima & maxima
-        # a = np.diff(np.sign(np.diff(y))).nonzero()[0] + 1      
-        # local min
-        valleys = (np.diff(np.sign(np.diff(y))) > 0).nonzero()[0] + 1 
-        # local max
-        peaks = (np.diff(np.sign(np.diff(y))) < 0).nonzero()[0] + 1         
-        # +1 -- diff reduces original index number
-
-        #store local minima and maxima -> identify + remove turning points
-        excursion_points = pd.DataFrame(columns=['Index', 'ds', 'y', 'Type'])
-        k=0
-        for i in range(len(peaks)):
-            excursion_points.loc[k] = [peaks[i]] + [self.filtered_df['ds'][k]] + [self.filtered_df['y'][k]] + ["P"]
-            k+=1
-
-        for i in range(len(valleys)):
-            excursion_points.loc[k] = [valleys[i]] + [self.filtered_df['ds'][k]] + [self.filtered_df['y'][k]] + ["V"]
-            k+=1
-
-        excursion_points = excursion_points.sort_values(by=['Index'])
-        excursion_points = excursion_points.reset_index(drop=True)
-
-
-        # selecting turning points
-        turning_points = pd.DataFrame(columns=['Index', 'ds', 'y', 'Type'])
-        k=0
-        for i in range(stdev,len(excursion_points.Index)-stdev):
-            positions = [i-stdev,i,i+stdev]
-            for j in range(0,len(positions)-1):
-                if(excursion_points.Type[positions[j]] == excursion_points.Type[positions[j+1]]):
-                    if(excursion_points.Type[positions[j]]=='P'):
-                        if excursion_points.y[positions[j]]>=excursion_points.y[positions[j+1]]:
-                            turning_points.loc[k] = excursion_points.loc[positions[j+1]]
-                            k+=1
-                        else:
-                            turning_points.loc[k] = excursion_points.loc[positions[j+1]]
-                            k+=1
-                    else:
-                        if excursion_points.y[positions[j]]<=excursion_points.y[positions[j+1]]:
-                            turning_points.loc[k] = excursion_points.loc[positions[j]]
-                            k+=1
-                        else:
-                            turning_points.loc[k] = excursion_points.loc[positions[j+1]]
-                            k+=1
-
-        if len(turning_points.index)<10:
-            turning_points = excursion_points.copy()
-            excursion_count = len(excursion_points.index)
-        else:
-            excursion_count = len(excursion_points.index)/2
-
-
-        turning_points = turning_points.drop_duplicates(subset= "Index", keep= "first")
-        turning_points=turning_points.reset_index(drop=True)
-        excursion_points = excursion_points[excursion_points.Index.isin(turning_points.Index) == False]
-        excursion_points = excursion_points.reset_index(drop=True)
-
-        # calculating MAGE
-        mage = turning_points.y.sum()/excursion_count
-        
-        return round(mage,3)
+        return mage(self.series.y, std, algorithm)
 
     def J_index(self):
         """
@@ -301,214 +500,177 @@ class CgmMetric:
 
             Computes and returns the J-index
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 J (float): J-index of y
                 
         """
-        J = 0.001*((np.mean(self.filtered_df['y'])+np.std(self.filtered_df['y']))**2)
+        stats = self.stats()
+        J = j_index(stats.mean, stats.std())
         return J
 
-    def LBGI_HBGI(self, i):
+    def risk_space(self):
         """
-            Connecter function to calculate rh and rl, used for ADRR function
+            Computes (once) and returns the low and high risk of every measurement, used for LBGI, HBGI and ADRR
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
-                LBGI (float): Low blood y index
-                HBGI (float): High blood y index
-                rl (float): See calculation of LBGI
-                rh (float): See calculation of HBGI
+                rl (np.ndarray): See calculation of LBGI
+                rh (np.ndarray): See calculation of HBGI
                 
         """
-        self.filtered_df = self.filtered_df[self.filtered_df['Day']==i]
-        f = ((np.log(self.filtered_df['y'])**1.084) - 5.381)
-        self.rl = []
-        for i in f: 
-            if (i <= 0):
-                self.rl.append(22.77*(i**2))
-            else:
-                self.rl.append(0)
-
-        self.LBGI = np.mean(self.rl)
-
-        self.rh = []
-        for i in f: 
-            if (i > 0):
-                self.rh.append(22.77*(i**2))
-            else:
-                self.rh.append(0)
-
-        self.HBGI = np.mean(self.rh)
-        
-        return self.LBGI, self.HBGI, self.rh, self.rl
+        if self._risk is None:
+            self._risk = risk_space(self.series.y)
+        return self._risk
 
     def LBGI(self):
         """
             Computes and returns the low blood y index
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 LBGI (float): Low blood y index
                 
         """
-        f = ((np.log(self.filtered_df['y'])**1.084) - 5.381)
-        rl = []
-        for i in f: 
-            if (i <= 0):
-                rl.append(22.77*(i**2))
-            else:
-                rl.append(0)
-
-        LBGI = np.mean(rl)
-        return LBGI
+        rl, rh = self.risk_space()
+        return lbgi(rl)
 
     def HBGI(self):
         """
             Computes and returns the high blood y index
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 HBGI (float): High blood y index
                 
         """
-        f = ((np.log(self.filtered_df['y'])**1.084) - 5.381)
-        rh = []
-        for i in f: 
-            if (i > 0):
-                rh.append(22.77*(i**2))
-            else:
-                rh.append(0)
-
-        HBGI = np.mean(rh)
-        return HBGI
+        rl, rh = self.risk_space()
+        return hbgi(rh)
 
     def ADRR(self):
         """
             Computes and returns the average daily risk range, an assessment of total daily y variations within risk space
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 ADRRx (float): average daily risk range
                 
         """
-        ADRRl = []
-        for i in pd.unique(self.filtered_df['Day']):
-            self.LBGI, self.HBGI, self.rh, self.rl = self.LBGI_HBGI(i)
-            LR = np.max(self.rl)
-            HR = np.max(self.rh)
-            ADRRl.append(LR+HR)
+        return self.daily()['risk_range'].mean()
+
+    def minute_of_day(self):
+        """
+            Returns the minute of the day of every measurement
+            Args:
+                (CgmSeries): compact glucose series
+            Returns:
+                minute_of_day (np.ndarray): minutes from midnight of each row
+                
+        """
+        return self.series.minute
 
-        ADRRx = np.mean(ADRRl)
-        return ADRRx
+    def grid(self):
+        """
+            Resamples (once) the series onto a fixed grid of its sampling interval, with NaN gaps
+            Args:
+                (CgmSeries): compact glucose series
+            Returns:
+                grid (Grid): see resample.resample
+                
+        """
+        if self._grid is None:
+            self._grid = resample(self.series)
+        return self._grid
+
+    def sensor_wear(self):
+        """
+            Returns the percentage of the grid slots between the first and last reading that have a reading
+        """
+        return self.grid().wear()
 
-    def uniquevalfilter(self, value):
+    def lagged_differences(self, hours=24):
         """
-            Supporting function for MODD and CONGA24 functions
+            Computes (once per lag) and returns the differences between each value and the value n hours before
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
-                value (datetime): time to match up with previous 24 hours
+                (CgmSeries): compact glucose series
+                hours (float): lag in hours (default=24)
             Returns:
-                MODD_n (float): Best matched with unique value, value
+                diff (np.ndarray): y minus the y measured n hours earlier
                 
         """
-        xdf = self.filtered_df[self.filtered_df['Minfrommid'] == value]
-        # n = len(xdf)
-        diff = abs(xdf['y'].diff())
-        self.MODD_n = np.nanmean(diff)
-        return self.MODD_n
+        if hours not in self._lags:
+            self._lags[hours] = lagged_differences(self.grid(), hours)
+        return self._lags[hours]
 
     def MODD(self):
         """
             Computes and returns the mean of daily differences. Examines mean of value + value 24 hours before
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Requires:
-                uniquevalfilter (function)
+                lagged_differences (function)
             Returns:
                 MODD (float): Mean of daily differences
                 
         """
-        self.filtered_df['Timefrommidnight'] =  self.filtered_df['ds'].dt.time
-        lists=[]
-        for i in range(0, len(self.filtered_df['Timefrommidnight'])):
-            lists.append(int(self.filtered_df['Timefrommidnight'][i].strftime('%H:%M:%S')[0:2])*60 + int(self.filtered_df['Timefrommidnight'][i].strftime('%H:%M:%S')[3:5]) + round(int(self.filtered_df['Timefrommidnight'][i].strftime('%H:%M:%S')[6:9])/60))
-        self.filtered_df['Minfrommid'] = lists
-        self.filtered_df = self.filtered_df.drop(columns=['Timefrommidnight'])
-        
-        #Calculation of MODD and CONGA:
-        MODD_n = []
-        uniquetimes = self.filtered_df['Minfrommid'].unique()
+        return modd(self.lagged_differences(24))
 
-        for i in uniquetimes:
-            MODD_n.append(self.uniquevalfilter(i))
-        
-        #Remove zeros from dataframe for calculation (in case there are random unique values that result in a mean of 0)
-        MODD_n[MODD_n == 0] = np.nan
-        
-        MODD = np.nanmean(MODD_n)
-        return MODD
+    def CONGA(self, n=24):
+        """
+            Computes and returns the continuous overall net glycemic action over n hours
+            Args:
+                (CgmSeries): compact glucose series
+                n (float): lag in hours (default=24)
+            Requires:
+                lagged_differences (function)
+            Returns:
+                CONGA (float): continuous overall net glycemic action over n hours
+                
+        """
+        return conga(self.lagged_differences(n))
 
     def CONGA24(self):
         """
             Computes and returns the continuous overall net glycemic action over 24 hours
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Requires:
-                uniquevalfilter (function)
+                lagged_differences (function)
             Returns:
                 CONGA24 (float): continuous overall net glycemic action over 24 hours
                 
         """
-        self.filtered_df['Timefrommidnight'] =  self.filtered_df['ds'].dt.time
-        lists=[]
-        for i in range(0, len(self.filtered_df['Timefrommidnight'])):
-            lists.append(int(self.filtered_df['Timefrommidnight'][i].strftime('%H:%M:%S')[0:2])*60 + int(self.filtered_df['Timefrommidnight'][i].strftime('%H:%M:%S')[3:5]) + round(int(self.filtered_df['Timefrommidnight'][i].strftime('%H:%M:%S')[6:9])/60))
-        self.filtered_df['Minfrommid'] = lists
-        self.filtered_df = self.filtered_df.drop(columns=['Timefrommidnight'])
-        
-        #Calculation of MODD and CONGA:
-        MODD_n = []
-        uniquetimes = self.filtered_df['Minfrommid'].unique()
-
-        for i in uniquetimes:
-            MODD_n.append(self.uniquevalfilter(i))
-        
-        #Remove zeros from dataframe for calculation (in case there are random unique values that result in a mean of 0)
-        MODD_n[MODD_n == 0] = np.nan
-        
-        CONGA24 = np.nanstd(MODD_n)
-        return CONGA24
+        return self.CONGA(24)
 
     def GMI(self):
         """
             Computes and returns the y management index
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 GMI (float): y management index (an estimate of HbA1c)
                 
         """
-        GMI = 3.31 + (0.02392*np.mean(self.filtered_df['y']))
+        GMI = gmi(self.stats().mean)
         return GMI
 
     def eA1c(self):
         """
             Computes and returns the American Diabetes Association estimated HbA1c
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 eA1c (float): an estimate of HbA1c from the American Diabetes Association
                 
         """
-        eA1c = (46.7 + np.mean(self.filtered_df['y']))/ 28.7 
+        eA1c = ea1c(self.stats().mean)
         return eA1c
 
     def summary(self): 
         """
             Computes and returns y summary metrics
             Args:
-                (pd.DataFrame): dataframe of data with DateTime, Time and y columns
+                (CgmSeries): compact glucose series
             Returns:
                 meanG (float): interday mean of y
                 medianG (float): interday median of y
@@ -518,44 +680,141 @@ class CgmMetric:
                 Q3G (float): interday third quartile of y
                 
         """
-        meanG = np.nanmean(self.filtered_dfdf['y'])
-        medianG = np.nanmedian(self.filtered_df['y'])
-        minG = np.nanmin(self.filtered_df['y'])
-        maxG = np.nanmax(self.filtered_df['y'])
-        Q1G = np.nanpercentile(self.filtered_df['y'], 25)
-        Q3G = np.nanpercentile(self.filtered_df['y'], 75)
+        stats = self.sorted_stats()
+        meanG = stats.mean
+        medianG = stats.quantile(0.5)
+        minG = stats.sorted_y[0]
+        maxG = stats.sorted_y[-1]
+        Q1G = stats.quantile(0.25)
+        Q3G = stats.quantile(0.75)
         
         return meanG, medianG, minG, maxG, Q1G, Q3G
 
+    def compute_all(self):
+        """
+            Computes the whole metrics panel in one pass, deriving the summary metrics from
+            the shared sufficient statistics and the variability ones from the cached arrays
+            Args:
+                (CgmSeries): compact glucose series
+            Returns:
+                report (MetricsReport): immutable record with one field per CgmMetric method
+                
+        """
+        return MetricsReport(
+            available_data=self.available_data(),
+            average_glucose=self.average_glucose(),
+            sd=self.sd(),
+            eA1c=self.eA1c(),
+            time_in_range=self.time_in_range(),
+            hyper_time=self.hyper_time(),
+            hypo_time=self.hypo_time(),
+            inter_qr=self.inter_qr(),
+            interdaysd=self.interdaysd(),
+            intradaysd=self.intradaysd()[0],
+            MAGE=self.MAGE(),
+            J_index=self.J_index(),
+            LBGI=self.LBGI(),
+            HBGI=self.HBGI(),
+            ADRR=self.ADRR(),
+            MODD=self.MODD(),
+            CONGA24=self.CONGA24(),
+            GMI=self.GMI(),
+        )
+
+    def rolling(self, days=14):
+        """
+            Computes the rolling metrics of the trailing `days` days for every day of the series
+            Args:
+                (CgmSeries): compact glucose series
+                days (integer): length of the window in days (default=14)
+            Returns:
+                df (pd.DataFrame): one row per day with n, mean, sd, CV, GMI, time_in_range, hypo_time and hyper_time
+                
+        """
+        return rolling_metrics(self.series, days)
+
+    def cached(self, name, compute, *settings):
+        """
+            Returns a chart table of this series from chart_cache, computing it on the first draw
+            Args:
+                (CgmSeries): compact glucose series
+                name (str): name of the table
+                compute (function): builds the table from the series and settings
+                settings: arguments of compute, part of the cache key
+            Returns:
+                table (object): the cached result of compute(series, *settings)
+                
+        """
+        if self._fingerprint is None:
+            self._fingerprint = self.series.fingerprint()
+        key = (self._fingerprint, name) + settings
+        table = chart_cache.get(key)
+        if table is None:
+            table = compute(self.series, *settings)
+            chart_cache.put(key, table)
+        return table
+
+    def agp(self, bin_minutes=5):
+        """
+            Computes (once per dataset and filters) and returns the Ambulatory Glucose Profile
+            Args:
+                (CgmSeries): compact glucose series
+                bin_minutes (integer): width of the time-of-day bins in minutes (default=5)
+            Returns:
+                df (pd.DataFrame): n, mean, std and 5th to 95th percentiles per time-of-day bin, see agp.agp
+                
+        """
+        return self.cached('agp', agp, bin_minutes)
+
+    def episodes(self):
+        """
+            Detects (once per dataset and filters) the hypo and hyper episodes of every consensus level
+            Args:
+                (CgmSeries): compact glucose series
+            Returns:
+                df (pd.DataFrame): one row per episode with level, start, end, duration, readings, extreme and mean
+                
+        """
+        return self.cached('episodes', episode_table)
+
+    def episode_summary(self):
+        """
+            Returns the number, mean and total duration and the nadir/peak of the episodes per level
+        """
+        return episode_summary(self.episodes())
+
     def best_day(self):
-        grouped_by_day = self.filtered_df.groupby('dd_mm_yy').mean()
-        grouped_by_day = grouped_by_day.assign(Best_Day = lambda x: (3.31 + (0.02392*(x['y']))))
-        best_day = grouped_by_day['y'].idxmin()
+        best_day = self.daily()['GMI'].idxmin().strftime('%d/%m/%Y')
 
         return best_day
 
-    def histogram(self):
-        # Add histogram data
-
-        in_range = (self.filtered_df['y'] >= 70) & (self.filtered_df['y'] <= 180)
-        in_range = self.filtered_df.loc[in_range]
-        in_range['Range'] = 'In range'
+    def worst_day(self):
+        worst_day = self.daily()['GMI'].idxmax().strftime('%d/%m/%Y')
 
-        in_hypo = (self.filtered_df['y'] < 70)
-        in_hypo = self.filtered_df.loc[in_hypo]
-        in_hypo['Range'] = 'Hypoglicemia'
+        return worst_day
 
-        in_hyper = (self.filtered_df['y'] > 180)
-        in_hyper = self.filtered_df.loc[in_hyper]
-        in_hyper['Range'] = 'Hyperglicemia'
+    def histogram(self, tiers='standard'):
+        """
+            Plots the share of readings in each glucose tier per weekday from a (7, tiers) count table,
+            so only the table is sent to the browser
+            Args:
+                (CgmSeries): compact glucose series
+                tiers (str): 'standard' (<70, 70-180, >180) or 'extended' (<54, 54-69, 70-180, 181-250, >250)
+                
+        """
+        counts = self.cached('ranges', weekday_ranges, tiers)
+        spec = RANGE_TIERS[tiers]
+        days = counts.sum(axis=1)
+        present = days > 0
+        percent = counts[present] / days[present, None] * 100
 
-        data = pd.concat([in_hypo, in_range])
-        data = pd.concat([data, in_hyper])
+        fig = go.Figure()
+        for i, (name, color) in enumerate(zip(spec['names'], spec['colors'])):
+            fig.add_trace(go.Bar(x=np.array(WEEKDAYS)[present], y=percent[:, i], name=name, marker_color=color,
+                                 customdata=counts[present, i], hovertemplate='%{y:.1f}% (%{customdata} readings)'))
 
-        fig = px.histogram(data, x="day_of_week", color="Range", barnorm='percent', title="Histogram of range frequencies",
-                        color_discrete_sequence=['#f54266', '#38cf77', '#4287f5']).update_xaxes(categoryorder='array',
-                        categoryarray= ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']).update_layout(yaxis_title="Percentage on ranges",
-                        xaxis_title='Day of Week', hovermode='x unified')
+        fig.update_layout(barmode='stack', title="Histogram of range frequencies", yaxis_title="Percentage on ranges",
+                          xaxis_title='Day of Week', hovermode='x unified')
 
         fig.update_traces(opacity=0.75, marker_line_width=.8, marker_line_color="white", marker_opacity=0.75)
 
@@ -568,32 +827,73 @@ class CgmMetric:
         # Plot!
         st.plotly_chart(fig, use_container_width=True)
 
-    def scatter(self):
+    def scatter_points(self, budget=2000, max_gap=3600):
+        """
+            Downsamples the glucose history for the scatter chart, breaking the line with NaN where
+            the sensor was off. Gaps are found on the raw readings and the reading on each side of
+            a gap is always kept, so the breaks do not depend on the spacing of the LTTB points.
+            Only the budget // 2 longest gaps are broken, so the chart gets at most 1.5 x budget
+            points on top of those of downsample, 4.5 x budget in all
+            Args:
+                (CgmSeries): compact glucose series
+                budget (integer): number of LTTB points (default=2000)
+                max_gap (integer): longest interval in seconds drawn as a line (default=3600)
+            Returns:
+                ts (np.ndarray): epoch seconds of the points, with a break point after each gap
+                y (np.ndarray): glucose of the points, NaN at the breaks
+                
+        """
+        index = self.cached('downsample', lambda series, budget: downsample(series.ts, series.y, budget), budget)
+        step = np.diff(self.series.ts)
+        gap_after = np.flatnonzero(step > max_gap)
+        if len(gap_after) > budget // 2:
+            # gaps closer than the chart can show are many: the shorter ones are drawn as a line
+            gap_after = np.sort(gap_after[np.argsort(-step[gap_after], kind='stable')[:budget // 2]])
+        index = np.union1d(index, np.r_[gap_after, gap_after + 1])
+        ts = self.series.ts[index].astype(float)
+        y = self.series.y[index].astype(float)
+        is_gap = np.zeros(len(self.series.ts), dtype=bool)
+        is_gap[gap_after] = True
+        breaks = np.flatnonzero(is_gap[index[:-1]]) + 1
+        ts = np.insert(ts, breaks, ts[breaks - 1] + 1)
+        y = np.insert(y, breaks, np.nan)
+        return ts, y
+
+    def scatter(self, budget=2000, webgl=True):
+        """
+            Plots the glucose history downsampled to about `budget` points with LTTB, keeping the
+            hypo and hyper extremes, so the payload stays bounded however long the history is
+            Args:
+                (CgmSeries): compact glucose series
+                budget (integer): number of points sent to the browser (default=2000)
+                webgl (bool): draw with Scattergl instead of SVG (default=True)
+                
+        """
+        ts, y = self.scatter_points(budget)
+        trace = go.Scattergl if webgl else go.Scatter
 
         # create a blank canvas
         fig = go.Figure()
 
         fig.add_trace(
-            go.Scatter(
-                x=self.filtered_df['ds']
-                , y=self.filtered_df['y']
+            trace(
+                x=pd.to_datetime(ts, unit='s')
+                , y=y
                 , name='Glucose'
+                , mode='lines'
                 , line=dict(color='royalblue', width=.7)
             ))
         
-        #px.scatter(df, x=df['ds'], y=df['y'])
-        # extract points as plain x and y
         fig.add_hline(y=180, line_color='red')
         fig.add_hline(y=70, line_color='red')
 
-        help_fig = px.scatter(self.filtered_df, x=self.filtered_df['ds'], y=self.filtered_df['y'], trendline="lowess", trendline_options=dict(frac=0.1))
-        # extract points as plain x and y
-        x_trend = help_fig["data"][1]['x']
-        y_trend = help_fig["data"][1]['y']
+        grid, trend = smooth(self.series.ts, self.series.y, frac=0.1)
+        x_trend = pd.to_datetime(grid, unit='s')
+        y_trend = trend
 
             # add the x,y data as a scatter graph object
         fig.add_trace(
-            go.Scatter(x=x_trend, y=y_trend, name='Glucose trend'))
+            trace(x=x_trend, y=y_trend, name='Glucose trend', mode='lines'))
 
         transparent = 'rgba(0,0,0,0)'
 
@@ -609,12 +909,10 @@ class CgmMetric:
 
         fig.update_layout(
                             xaxis = dict(
-                                type = 'category',
+                                type = 'date',
                                 showgrid=True,
                                 ticks="outside",
-                                tickson="boundaries",
-                                ticklen=1,
-                                visible=False
+                                ticklen=1
                             ),
                             yaxis = dict(showgrid=False)
                         )
@@ -623,13 +921,8 @@ class CgmMetric:
 
     def one_day_scatter(self):
 
-        self.filtered_df.reset_index(drop=True, inplace=True)
-        mean_df = self.filtered_df.groupby('hh_mm').mean()
-        mean_df.reset_index(drop=False, inplace=True)
-        mean_df['hh_mm'] = pd.to_datetime(mean_df['hh_mm'])
-        std_df = self.filtered_df.groupby('hh_mm').std()
-        std_df.reset_index(drop=False, inplace=True)
-        std_df['hh_mm'] = pd.to_datetime(std_df['hh_mm'])
+        by_minute = self.agp(1)
+        by_minute = by_minute[by_minute['n'] > 0]
 
         # create a blank canvas
         fig = go.Figure()
@@ -637,19 +930,14 @@ class CgmMetric:
         fig.add_hline(y=140, line_color='purple')
         fig.add_hline(y=100, line_color='purple')
 
-        help_fig = px.scatter(mean_df, x=mean_df['hh_mm'], y=mean_df['y'], trendline="lowess", trendline_options=dict(frac=0.1))
-        help_fig2 = px.scatter(mean_df, x=mean_df['hh_mm'], y=mean_df['y']+std_df['y'], trendline="lowess", trendline_options=dict(frac=0.1))
-        help_fig3 = px.scatter(mean_df, x=mean_df['hh_mm'], y=mean_df['y']-std_df['y'], trendline="lowess", trendline_options=dict(frac=0.1))
-
-        # extract points as plain x and y
-        x_trend = help_fig["data"][1]['x']
-        y_trend = help_fig["data"][1]['y']
-
-        upper_x_trend = help_fig2["data"][1]['x']
-        upper_y_trend = help_fig2["data"][1]['y']
-
-        lower_x_trend = help_fig3["data"][1]['x']
-        lower_y_trend = help_fig3["data"][1]['y']
+        minutes = by_minute.index.to_numpy()
+        mean = by_minute['mean'].to_numpy()
+        std = by_minute['std'].to_numpy()
+        banded = ~np.isnan(std)
+        x_trend, y_trend = smooth(minutes, mean, frac=0.1)
+        upper_x_trend, upper_y_trend = smooth(minutes[banded], (mean + std)[banded], frac=0.1)
+        lower_x_trend, lower_y_trend = smooth(minutes[banded], (mean - std)[banded], frac=0.1)
+        x_trend, upper_x_trend, lower_x_trend = (pd.to_datetime(x, unit='m') for x in (x_trend, upper_x_trend, lower_x_trend))
 
             # add the x,y data as a scatter graph object
         fig.add_trace(
@@ -682,4 +970,68 @@ class CgmMetric:
 
         fig.update_layout(xaxis_tickformat = '%H:%M', yaxis = dict(showgrid=False))
 
-        st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+        st.plotly_chart(fig, use_container_width=True)
+
+    def rolling_chart(self, days=14):
+
+        rolling = self.rolling(days)
+
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.08)
+
+        fig.add_trace(go.Scatter(x=rolling.index, y=rolling['time_in_range'], name='Time in range', line=dict(color='#38cf77')), row=1, col=1)
+        fig.add_trace(go.Scatter(x=rolling.index, y=rolling['hypo_time'], name='Time in hypo', line=dict(color='#f54266')), row=1, col=1)
+        fig.add_trace(go.Scatter(x=rolling.index, y=rolling['CV'], name='CV', line=dict(color='#4287f5')), row=1, col=1)
+        fig.add_trace(
+            go.Scatter(
+                x=rolling.index,
+                y=rolling['mean'],
+                name='Average glucose',
+                customdata=rolling['GMI'],
+                hovertemplate='%{y:.0f}mg/dL (GMI %{customdata:.2f}%)',
+                line=dict(color='royalblue')),
+            row=2, col=1)
+
+        transparent = 'rgba(0,0,0,0)'
+
+        fig.update_layout(
+            hovermode='x unified',
+            paper_bgcolor=transparent,
+            plot_bgcolor=transparent,
+            title=f'Rolling {days}-day metrics'
+        )
+
+        fig.update_yaxes(title_text='%', showgrid=False, row=1, col=1)
+        fig.update_yaxes(title_text='Glucose (mg/dL)', showgrid=False, row=2, col=1)
+
+        st.plotly_chart(fig, use_container_width=True)
+
+    def agp_chart(self):
+
+        profile = self.agp()
+        hh_mm = pd.to_datetime(profile.index.to_numpy(), unit='m')
+
+        fig = go.Figure()
+
+        fig.add_hrect(y0=70, y1=180, fillcolor='#38cf77', opacity=0.1, line_width=0)
+
+        fig.add_trace(go.Scatter(x=hh_mm, y=profile['p95'], name='95th percentile', line=dict(color='#4287f5', width=.5, dash='dot')))
+        fig.add_trace(go.Scatter(x=hh_mm, y=profile['p5'], name='5th percentile', line=dict(color='#4287f5', width=.5, dash='dot'),
+                                 fill='tonexty', fillcolor='rgba(66, 135, 245, 0.15)'))
+        fig.add_trace(go.Scatter(x=hh_mm, y=profile['p75'], name='75th percentile', line=dict(color='#4287f5', width=.5)))
+        fig.add_trace(go.Scatter(x=hh_mm, y=profile['p25'], name='25th percentile', line=dict(color='#4287f5', width=.5),
+                                 fill='tonexty', fillcolor='rgba(66, 135, 245, 0.35)'))
+        fig.add_trace(go.Scatter(x=hh_mm, y=profile['p50'], name='Median', line=dict(color='royalblue', width=2)))
+
+        transparent = 'rgba(0,0,0,0)'
+
+        fig.update_layout(
+            yaxis_title='Glucose (mg/dL)',
+            hovermode='x unified',
+            paper_bgcolor=transparent,
+            plot_bgcolor=transparent,
+            title='Ambulatory glucose profile - median, 25-75% and 5-95% bands'
+        )
+
+        fig.update_layout(xaxis_tickformat = '%H:%M', yaxis = dict(showgrid=False))
+
+        st.plotly_chart(fig, use_container_width=True)